@@ -0,0 +1,176 @@
+'''
+Times the session readers and the analyses on synthetic cohorts of increasing size.
+
+Every cohort is written once by syntheticSessions under BENCHMARK_DIR and reused afterwards. For
+each cohort size the parsing and caching layers are timed over all the files, the per-subject
+readers and plots over a sample of SAMPLE_SIZE files (loading them from their binary caches), and
+the combined analyses and plots over the whole cohort. Every measurement is printed and appended
+as a JSON line to the results file (RESULTS_FILE unless --results is given), which is kept outside
+the temporary directory so that runs on different commits or machines can be compared.
+
+Usage: python benchmark.py [--workers n] [--results file] [subjects ...]   (default 24 1000 10000 subjects)
+'''
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import colorPreferenceAnalysis as analysis
+import sessionData
+import syntheticSessions
+import trialTable
+
+SIZES = (24, 1000, 10000)
+SAMPLE_SIZE = 24                  # sessions the per-subject readers and plots are timed on
+MAX_SENSITIVITY_SUBJECTS = 1000   # exclusionSensitivity builds a subsets x subjects matrix
+BENCHMARK_DIR = os.path.join(tempfile.gettempdir(), 'colorPrefBenchmark')
+RESULTS_FILE = os.path.join(os.path.expanduser('~'), 'colorPrefBenchmarkResults.jsonl')
+
+def _commit():
+    '''Returns the git commit of the code being benchmarked, or None outside of a checkout.'''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Benchmark(object):
+    '''Times calls and records the measurements of one run.'''
+
+    def __init__(self, workers, resultsFile=RESULTS_FILE):
+        self.workers = workers
+        self.resultsFile = resultsFile
+        self.run = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': _commit(), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'machine': platform.node(), 'workers': workers}
+        self.results = []
+        resultsDir = os.path.dirname(os.path.abspath(resultsFile))
+        if not os.path.isdir(resultsDir):
+            os.makedirs(resultsDir)
+
+    def time(self, subjects, name, func, *args):
+        '''
+        Calls func(*args) with the analysis logging below warnings silenced and records how long it
+        took for a cohort of the given size. Returns the result of the call.
+        '''
+        level = analysis.log.level
+        analysis.log.setLevel(logging.WARNING)
+        try:
+            start = time.time()
+            result = func(*args)
+            seconds = time.time() - start
+        finally:
+            analysis.log.setLevel(level)
+        self.record(subjects, name, seconds)
+        return result
+
+    def timeEach(self, subjects, name, func, argTuples):
+        '''Times func over each of the given argument tuples and records the total and the time per call.'''
+        start = time.time()
+        for args in argTuples:
+            self.time(subjects, None, func, *args)
+        self.record(subjects, name, time.time() - start, len(argTuples))
+
+    def record(self, subjects, name, seconds, calls=1):
+        '''Records a measurement of the given name (measurements without a name are not recorded).'''
+        if name is None:
+            return
+        result = dict(self.run, subjects=subjects, name=name, seconds=seconds, calls=calls, perCall=seconds / calls)
+        self.results.append(result)
+        print '%6d subjects  %-40s %10.3f s  %10.5f s/call' % (subjects, name, seconds, seconds / calls)
+        with open(self.resultsFile, 'a') as f:
+            f.write(json.dumps(result, sort_keys=True) + '\n')
+
+def _removeSidecars(dataDir):
+    '''Removes the caches, indices and summary table kept next to the session files.'''
+    for pattern in ('*.txt.npz', '*.txt.idx', '*.trials', 'subjectSummary.npz'):
+        for path in glob.glob(os.path.join(dataDir, pattern)):
+            os.remove(path)
+    sessionData.clearSessionCache()
+
+def cohort(bench, subjects):
+    '''Returns the data directory and ids of the synthetic cohort of the given size, writing it if needed.'''
+    dataDir = os.path.join(BENCHMARK_DIR, str(subjects)) + os.sep
+    ids = syntheticSessions.cohortIds(subjects)
+    if not all(os.path.exists(dataDir + 'expData' + id + '.txt') for id in ids):
+        bench.time(subjects, 'writeCohort', syntheticSessions.writeCohort, dataDir, subjects, 0, bench.workers)
+    return dataDir, ids
+
+def benchmarkCohort(bench, subjects):
+    '''Runs all the timings on the synthetic cohort of the given size.'''
+    dataDir, ids = cohort(bench, subjects)
+    analysis.DATA_DIR, analysis.SUBJECTS, analysis.WORKERS = dataDir, ids, bench.workers
+    files = [analysis.subjectFile(id) for id in ids]
+    sample = files[:SAMPLE_SIZE]
+    figDir = os.path.join(BENCHMARK_DIR, 'figures', str(subjects)) + os.sep
+    if not os.path.isdir(figDir):
+        os.makedirs(figDir)
+
+    # Parsing and caching
+    _removeSidecars(dataDir)
+    bench.timeEach(subjects, 'parseSession (building index)', sessionData.parseSession, [(f,) for f in sample])
+    bench.timeEach(subjects, 'parseSession (indexed)', sessionData.parseSession, [(f,) for f in sample])
+    _removeSidecars(dataDir)
+    bench.time(subjects, 'loadSessions (cold)', sessionData.loadSessions, files, bench.workers)
+    sessionData.clearSessionCache()
+    bench.time(subjects, 'loadSessions (disk cache)', sessionData.loadSessions, files, bench.workers)
+    bench.timeEach(subjects, 'convertSession', sessionData.convertSession, [(f,) for f in sample])
+    bench.timeEach(subjects, 'readTrialRecords', sessionData.readTrialRecords,
+                   [(sessionData.recordPath(f),) for f in sample])
+    sessionData.clearSessionCache()
+    bench.time(subjects, 'pooledTrials', trialTable.pooledTrials, files, bench.workers)
+
+    # Per-subject readers and plots, each group loading its sessions from the binary caches on disk
+    # as a new analysis run would rather than from the sessions still held in memory
+    for name, args in [('breaksToDict', (True,)), ('breaksHistory', (True,)), ('breakAvgsLR', ()),
+                       ('prefsToDict', (True,)), ('colorlist', ()), ('calibrationHistory', ()),
+                       ('oriTaskAcc', (False,)), ('oriTaskSpd', ()), ('effectStrengths', ()),
+                       ('subjectSummary', ())]:
+        sessionData.clearSessionCache()
+        bench.timeEach(subjects, name, getattr(analysis, name), [(f,) + args for f in sample])
+    sessionData.clearSessionCache()
+    bench.timeEach(subjects, 'stimLocAcc', analysis.stimLocAcc, [(0, f) for f in sample])
+    for plot in analysis.SUBJECT_PLOTS:
+        sessionData.clearSessionCache()
+        bench.timeEach(subjects, plot.__name__, plot, [(f, figDir) for f in sample])
+
+    # Combined analyses
+    if os.path.exists(analysis.summaryPath()):
+        os.remove(analysis.summaryPath())
+    sessionData.clearSessionCache()
+    bench.time(subjects, 'summaryTable (cold)', analysis.summaryTable, ids)
+    bench.time(subjects, 'summaryTable (stored)', analysis.summaryTable, ids)
+    bench.time(subjects, 'breakTimeHistories', analysis.breakTimeHistories, ids, True)
+    bench.time(subjects, 'plotCombinedST', analysis.plotCombinedST, figDir)
+    bench.time(subjects, 'plotCombinedSTDiff', analysis.plotCombinedSTDiff, figDir)
+    bench.time(subjects, 'plotSTbyHue', analysis.plotSTbyHue, figDir)
+    bench.time(subjects, 'plotCombinedOA', analysis.plotCombinedOA, ids, figDir)
+    bench.time(subjects, 'plotCombinedOS', analysis.plotCombinedOS, ids, figDir)
+    bench.time(subjects, 'plotEffectCorr', analysis.plotEffectCorr, ids, figDir)
+    bench.time(subjects, 'accOutliers', analysis.accOutliers, ids, 3)
+    if subjects <= MAX_SENSITIVITY_SUBJECTS:
+        bench.time(subjects, 'exclusionSensitivity', analysis.exclusionSensitivity, ids, 1)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = 1
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    resultsFile = RESULTS_FILE
+    if '--results' in args:
+        i = args.index('--results')
+        resultsFile = args[i + 1]
+        del args[i:i + 2]
+    bench = Benchmark(workers, resultsFile)
+    for subjects in [int(arg) for arg in args] or SIZES:
+        benchmarkCohort(bench, subjects)
+    print 'Results appended to ' + resultsFile
@@ -1,10 +1,86 @@
+import atexit
+import hashlib
+import inspect
+import logging
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import stats 
+import sessionData
+from figureBuild import FigureBuild
+from profiling import Profiler
+from resampling import effectInference, correlationInference
+from runningStats import RunningStats, mergeAll
+from trialHistory import historyMatrix, binnedMeans
+from sensitivity import sensitivityTable
+from sessionData import parallelMap
+from trialTable import (EXP1, CUE_CONDITIONS, MIN_BREAK_TIME, CENSOR_TIME, TrialQuery, pooledTrials, groupStats,
+                        conditionStats, clipMask, outlierMask)
 
 SUBJECTS = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10',
             '11', '12', '13', '14', '16', '17', '18', '19', '20', '21',
             '23', '25', '26', '27']  # '00' is myself
+DATA_DIR = '/home/shimojolab/PsychopyExperiments/colorPrefData/'
+WORKERS = 1  # processes used for per-subject work, None for one per core
+RESAMPLE_SEED = 0  # seed of the permutation and bootstrap resamples, None for different ones every run
+OUTLIER_SDS = 3  # distance from the mean, in standard deviations, beyond which suppression times are outliers
+PROFILER = Profiler()  # records the stages of a run once enabled, see --profile
+
+log = logging.getLogger('colorPreferenceAnalysis')
+
+def subjectFile(id):
+    '''Returns the path of the session file of the subject with the given id.'''
+    return DATA_DIR + 'expData' + id + '.txt'
+
+def _subjectId(filename):
+    '''Returns the id of the subject of the given session file.'''
+    return os.path.basename(filename)[len('expData'):-len('.txt')]
+
+@PROFILER.profiled('loadSession')
+def loadSession(source):
+    '''Returns sessionData.loadSession(source), recorded as the loadSession stage.'''
+    return sessionData.loadSession(source)
+
+def _subjectStage(func, filename, parentPid, args):
+    '''
+    Returns func(filename, *args), recorded as the stage of the function's name for the subject of
+    the file, along with the PROFILER records of the call if it ran in a worker process (else None).
+    '''
+    inWorker = os.getpid() != parentPid
+    if inWorker:
+        PROFILER.enable().reset()
+    with PROFILER.stage(func.__name__, _subjectId(filename)):
+        result = func(filename, *args)
+    return result, PROFILER.records() if inWorker else None
+
+def _subjectMap(func, argTuples, workers):
+    '''
+    Returns parallelMap(func, argTuples, workers) for a func whose first argument is a session file,
+    recording every call as a stage of that file's subject (in worker processes too) if PROFILER is enabled.
+    '''
+    if not PROFILER.enabled:
+        return parallelMap(func, argTuples, workers)
+    results = parallelMap(_subjectStage, [(func, args[0], os.getpid(), args[1:]) for args in argTuples], workers)
+    for result, records in results:
+        if records is not None:
+            PROFILER.merge(records)
+    return [result for result, records in results]
+
+def mapSubjects(func, ids, *args):
+    '''
+    Returns [func(subjectFile(id), *args) for id in ids] computed over WORKERS processes, in the
+    order of ids. func must be a module-level function such as oriTaskAcc or oriTaskSpd.
+    '''
+    return _subjectMap(func, [(subjectFile(id),) + args for id in ids], WORKERS)
+
+def _screenedBreaks(trials, includeAll):
+    '''
+    Returns the breaking times of the given first experiment trials along with a mask of the
+    trials that passed the screening used by breaksToDict and breaksHistory.
+    '''
+    brkTimes = np.minimum(trials['brkTime'], CENSOR_TIME) if includeAll else trials['brkTime']
+    return brkTimes, TrialQuery(trials).breakWindow(MIN_BREAK_TIME, CENSOR_TIME, includeAll).passed().mask
 
 def breaksToDict(filename, includeAll):
     '''
@@ -13,65 +89,37 @@ def breaksToDict(filename, includeAll):
     The includeAll parameter indicates whether or not the trials that became definitely 
     visible should be included as max-duration breaking.
     '''
+    session = loadSession(filename)
+    brkTimes, keep = _screenedBreaks(session.exp1, includeAll)
+    codes = session.exp1['color']
     data = {}
-    with open(filename, 'r') as f:
-        reading = False
-        for line in f:
-            if line == 'START1\n':
-                reading = True
-                continue
-            elif line == 'END1\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                color, loc, brkTime, tstPass = trialData
-                brkTime = float(brkTime)
-                passedScreen = brkTime > 0.3 and brkTime < 10.23
-                if includeAll:
-                    brkTime = min(brkTime, 10.23)
-                    passedScreen = brkTime > 0.3 
-                if passedScreen and tstPass == 'True':
-                    if color not in data.keys():
-                        data[color] = [brkTime]
-                    else:
-                        data[color].append(brkTime)
+    for code in np.unique(codes[keep]):
+        data[session.colors[code]] = brkTimes[keep & (codes == code)].tolist()
     return data
   
 def breaksHistory(filename, includeAll):
     '''
     Reads in the breaking times from the first experiment and returns them as a list 
-    of the mean breaking times for each 30-trial section in chronological order.
+    of the mean breaking times for each 30-trial section in chronological order
+    (NaN for a section in which no trial passed the screening).
     The includeAll parameter indicates whether or not the trials that became definitely 
     visible should be included as max-duration breaking.
     '''
-    data = []
-    with open(filename, 'r') as f:
-        reading = False
-        trial = 0
-        binSum, binCount = 0, 0
-        for line in f:
-            if line == 'START1\n':
-                reading = True
-                continue
-            elif line == 'END1\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                color, loc, brkTime, tstPass = trialData
-                brkTime = float(brkTime)
-                passedScreen = brkTime > 0.3 and brkTime < 10.23
-                if includeAll:
-                    brkTime = min(brkTime, 10.23)
-                    passedScreen = brkTime > 0.3 
-                if passedScreen and tstPass == 'True':
-                    binSum += brkTime
-                    binCount += 1
-                if trial % 30 == 29:
-                    data.append(binSum / binCount)
-                    binSum = 0
-                    binCount = 0
-            trial += 1
-    return data
+    trials = loadSession(filename).exp1
+    brkTimes, keep = _screenedBreaks(trials, includeAll)
+    return binnedMeans(np.where(keep, brkTimes, np.nan), 30)[0].tolist()
+
+def breakTimeHistories(ids, includeAll):
+    '''
+    Returns a len(ids) x trials array of the breaking times of the first experiment of the given
+    subjects in trial order, with NaN for the trials that did not pass the screening of
+    breaksToDict, for binnedMeans, rollingMeans and ewmaMeans over all the subjects at once.
+    '''
+    with PROFILER.stage('pooledTrials'):
+        trials = pooledTrials([subjectFile(id) for id in ids], WORKERS)
+    trials = trials[trials['section'] == EXP1]
+    brkTimes, keep = _screenedBreaks(trials, includeAll)
+    return historyMatrix(trials, np.where(keep, brkTimes, np.nan))
    
    
 def breakAvgsLR(filename):
@@ -81,24 +129,9 @@ def breakAvgsLR(filename):
         
     (left mean, right mean, left stdev, right stdev)
     '''
-    left, right = [], []
-    with open(filename, 'r') as f:
-        reading = False
-        for line in f:
-            if line == 'START1\n':
-                reading = True
-                continue
-            elif line == 'END1\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                color, loc, brkTime, tstPass = trialData
-                brkTime = float(brkTime)
-                if brkTime > 0.1 and brkTime < 10.23 and tstPass == 'True':
-                    if float(loc) < 0:
-                        left.append(brkTime)
-                    else:
-                        right.append(brkTime)
+    query = TrialQuery(loadSession(filename).exp1).breakWindow(0.1, CENSOR_TIME).passed()
+    left = query.left().values('brkTime')
+    right = query.left(False).values('brkTime')
     return (np.mean(left), np.mean(right), np.std(left), np.std(right))
 
 def prefsToDict(filename, colorsAreKeys):
@@ -107,57 +140,46 @@ def prefsToDict(filename, colorsAreKeys):
     If colorsAreKeys is passed as True, then the color triplets are the keys of the return
     dictionary. If False, then the preference ranks are the keys.
     '''
+    session = loadSession(filename)
     data = {}
-    with open(filename, 'r') as f:
-        for line in f:
-            if line[0] == 'p':
-                prefs = line.strip().split(' ')[1:]
-                for pref in prefs:
-                    if colorsAreKeys:
-                        data[pref[:-1]] = int(pref[-1])
-                    else:
-                        data[int(pref[-1])] = pref[:-1]
+    for color, rank in zip(session.colors, session.ranks.tolist()):
+        if rank > 0:
+            if colorsAreKeys:
+                data[color] = rank
+            else:
+                data[rank] = color
     return data
 
 
 def colorlist(filename):
     '''Returns colors used in first experiment in canonical rainbow order.'''
-    data = []
-    with open(filename, 'r') as f:
-        for line in f:
-            if line[0] == 'p':
-                prefs = line.strip().split(' ')[1:]
-                for pref in prefs:
-                    data.append(pref[:-1])
-    return data
+    return loadSession(filename).rankedColors()
     
 def removeOutliers(nums):
-    '''Removes elements more than 3 standard deviations from the mean in an array of numbers.'''
-    lower = np.mean(nums) - 3 * np.std(nums)
-    upper = np.mean(nums) + 3 * np.std(nums)
-    for i in range(len(nums) - 1, -1, -1):
-        if nums[i] < lower or nums[i] > upper:
-            nums.pop(i)
+    '''Removes elements more than OUTLIER_SDS standard deviations from the mean in a list of numbers.'''
+    with PROFILER.stage('outliers'):
+        keep = clipMask(np.zeros(len(nums), dtype=int), nums, threshold=OUTLIER_SDS)
+    nums[:] = [num for num, kept in zip(nums, keep) if kept]
 
 def calibrationHistory(filename):
     '''Returns the history of tilt magnitudes for both calibration staircases in chronological order.'''
-    tiltMags1, tiltMags2 = [], []
-    with open(filename, 'r') as f:
-        reading = False
-        for line in f:
-            if line == 'CALIB\n':
-                reading = True
-                continue
-            elif line == 'START2\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                if len(trialData) > 1:
-                    if trialData[0] == '0':
-                        tiltMags1.append(abs(float(trialData[4][:-1])))
-                    elif trialData[0] == '1':
-                        tiltMags2.append(abs(float(trialData[4][:-1])))
-    return tiltMags1, tiltMags2
+    trials = loadSession(filename).calib
+    tiltMags = np.abs(trials['tilt'])
+    return tiltMags[trials['stair'] == 0].tolist(), tiltMags[trials['stair'] == 1].tolist()
+
+def oriTaskStats(filename, includeCalib):
+    '''
+    Returns the conditionStats (count, accuracy, response time mean and variance, location guess
+    accuracy) per cue condition of the orientation task trials in which the prime was reported
+    invisible, from the second experiment and, if includeCalib is True, the calibration.
+    '''
+    session = loadSession(filename)
+    trials = np.concatenate((session.calib, session.exp2)) if includeCalib else session.exp2
+    return conditionStats(trials, ('cue',), TrialQuery(trials).visibility(0).mask)
+
+def _byCue(condStats, column):
+    '''Returns a dictionary mapping the labels of the cue conditions to the given column of the given conditionStats.'''
+    return dict((CUE_CONDITIONS[cue], value) for cue, value in zip(condStats['cue'].tolist(), condStats[column].tolist()))
     
 def oriTaskAcc(filename, includeCalib):
     '''
@@ -165,60 +187,7 @@ def oriTaskAcc(filename, includeCalib):
     dictionary where the keys are labels of the relevant configurations and the values are 
     proportions of correct responses.
     '''
-    corrects = {'favSame': 0, 'favOpp': 0, 'leastFavSame': 0, 'leastFavOpp': 0}
-    totals = {'favSame': 0, 'favOpp': 0, 'leastFavSame': 0, 'leastFavOpp': 0}
-    topCorrects, bottomCorrects, tops, bottoms = 0, 0, 0, 0
-    with open(filename, 'r') as f:
-        reading = False
-        for line in f:
-            if (includeCalib and line == 'CALIB\n') or line == 'START2\n':
-                reading = True
-                continue
-            elif line == 'END2\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                if len(trialData) > 8:
-                    calib = 1
-                elif len(trialData) < 2:
-                    continue
-                else:
-                    calib = 0
-                popCol, popLoc, gabLoc, passedTask, visibility = trialData[0 + calib][1:-1], trialData[1 + calib][:-1], \
-                                                                 trialData[2 + calib][:-1], trialData[5 + calib], trialData[6 + calib]
-                if visibility == '0':
-                    if popCol == '1':
-                        if popLoc == gabLoc:
-                            if passedTask == 'True':
-                                corrects['favSame'] += 1
-                            totals['favSame'] += 1
-                        else:
-                            if passedTask == 'True':
-                                corrects['favOpp'] += 1
-                            totals['favOpp'] += 1
-                    else:
-                        if popLoc == gabLoc:
-                            if passedTask == 'True':
-                                corrects['leastFavSame'] += 1
-                            totals['leastFavSame'] += 1
-                        else:
-                            if passedTask == 'True':
-                                corrects['leastFavOpp'] += 1
-                            totals['leastFavOpp'] += 1
-                    if float(gabLoc) > 0:
-                        if passedTask == 'True':
-                            topCorrects += 1
-                        tops += 1
-                    else:
-                        if passedTask == 'True':
-                            bottomCorrects += 1
-                        bottoms += 1
-    for c in corrects.keys():
-        corrects[c] = float(corrects[c]) / totals[c]
-    #print 'Total numbers of invisible trials: ' + str(totals)
-    #print 'Accuracy in upper half: ' + str(topCorrects) + '/' + str(tops)
-    #print 'Accuracy in lower half: ' + str(bottomCorrects) + '/' + str(bottoms)
-    return corrects
+    return _byCue(oriTaskStats(filename, includeCalib), 'accuracy')
     
     
 def oriTaskSpd(filename):
@@ -227,143 +196,205 @@ def oriTaskSpd(filename):
     dictionary where the keys are labels of the relevant configurations and the values are 
     mean response times.
     '''
-    corrects = {'favSame': 0, 'favOpp': 0, 'leastFavSame': 0, 'leastFavOpp': 0}
-    totals = {'favSame': 0, 'favOpp': 0, 'leastFavSame': 0, 'leastFavOpp': 0}
-    topCorrects, bottomCorrects, tops, bottoms = 0, 0, 0, 0
-    with open(filename, 'r') as f:
-        reading = False
-        for line in f:
-            if line == 'START2\n':
-                reading = True
-                continue
-            elif line == 'END2\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                popCol, popLoc, gabLoc, reactTime, visibility = trialData[0][1:-1], trialData[1][:-1], \
-                                                                trialData[2][:-1], trialData[4], trialData[6]
-                if visibility == '0':
-                    if popCol == '1':
-                        if popLoc == gabLoc:
-                            corrects['favSame'] += float(reactTime)
-                            totals['favSame'] += 1
-                        else:
-                            corrects['favOpp'] += float(reactTime)
-                            totals['favOpp'] += 1
-                    else:
-                        if popLoc == gabLoc:
-                            corrects['leastFavSame'] += float(reactTime)
-                            totals['leastFavSame'] += 1
-                        else:
-                            corrects['leastFavOpp'] += float(reactTime)
-                            totals['leastFavOpp'] += 1
-                    if float(gabLoc) > 0:
-                        topCorrects += float(reactTime)
-                        tops += 1
-                    else:
-                        bottomCorrects += float(reactTime)
-                        bottoms += 1
-    for c in corrects.keys():
-        corrects[c] = corrects[c] / totals[c]
-    print 'Total numbers of invisible trials: ' + str(totals)
-    print 'Mean response time in upper half: ' + str(topCorrects / tops)
-    print 'Mean response time in lower half: ' + str(bottomCorrects / bottoms)
-    return corrects
+    trials = loadSession(filename).exp2
+    invisible = TrialQuery(trials).visibility(0).mask
+    condStats = conditionStats(trials, ('cue',), invisible)
+    halves = conditionStats(trials, ('gaborTop',), invisible)
+    halves = dict(zip(halves['gaborTop'].tolist(), halves['meanRT'].tolist()))
+    log.debug('Total numbers of invisible trials: %s', _byCue(condStats, 'count'))
+    log.debug('Mean response time in upper half: %s', halves.get(1))
+    log.debug('Mean response time in lower half: %s', halves.get(0))
+    return _byCue(condStats, 'meanRT')
 
 def stimLocAcc(isVisible, filename):
     '''
     Reads in the orientation task results from the second experiment and returns the proportion
     of trials of the given reported visibility in which the target stimulus location was guessed correctly.
     '''
-    correct, total = 0, 0
-    with open(filename, 'r') as f:
-        reading = False
-        for line in f:
-            if line == 'START2\n':
-                reading = True
-                continue
-            elif line == 'END2\n':
-                break
-            if reading:
-                trialData = line.strip().split(' ')
-                popLoc, visibility, locSeen = trialData[1][:-1], trialData[6], trialData[7]
-                if (not isVisible and visibility == '0') or (isVisible and not visibility == '0'):
-                    if (popLoc[0] == '-' and locSeen == 'down') or (popLoc[0] == '0' and locSeen == 'up'):
-                        correct += 1
-                    total += 1 
-    if total == 0:
+    byVisible = conditionStats(loadSession(filename).exp2, ('visible',))
+    selected = byVisible['locAccuracy'][byVisible['visible'] == bool(isVisible)]
+    if len(selected) == 0:
         return -1
-    return float(correct) / total
+    return float(selected[0])
     
-def plotST(inFile, outDir):
+SUMMARY_VERSION = 1
+SUMMARY_DTYPE = np.dtype([('id', 'S8'),               # subject id
+                          ('size', 'i8'),             # size of the session file the row was computed from
+                          ('mtime', 'f8'),            # modification time of that file
+                          ('rankST', 'f8', (6,)),     # mean suppression time of each preference rank, most favorite first
+                          ('normST', 'f8'),           # normalized favorite vs least favorite suppression time difference
+                          ('count', 'i8', (4,)),      # invisible orientation task trials of each of CUE_CONDITIONS
+                          ('accuracy', 'f8', (4,)),   # orientation task accuracy of each of CUE_CONDITIONS
+                          ('meanRT', 'f8', (4,))])    # mean response time of each of CUE_CONDITIONS
+
+def summaryPath():
+    '''Returns the path of the per-subject summary table kept next to the session files.'''
+    return DATA_DIR + 'subjectSummary.npz'
+
+def subjectSummary(filename):
+    '''
+    Returns a one-row SUMMARY_DTYPE array of the per-subject metrics of the given session file: the
+    suppression times (including trials that became definitely visible) by rank as in rankMeansST
+    and the second experiment's oriTaskAcc (without calibration) and oriTaskSpd by cue condition.
+    '''
+    session = loadSession(filename)
+    row = np.zeros(1, dtype=SUMMARY_DTYPE)
+    brkTimes, keep = _screenedBreaks(session.exp1, True)
+    ranks = session.ranks[session.exp1['color']]
+    keep &= ranks > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rankST = np.bincount(ranks[keep], brkTimes[keep], 7)[1:7] / np.bincount(ranks[keep], minlength=7)[1:7]
+        row['normST'] = (rankST[0] - rankST[5]) / (rankST[0] + rankST[5]) * 2
+    row['rankST'] = rankST
+    condStats = oriTaskStats(session, False)
+    for column in ('accuracy', 'meanRT'):
+        row[column] = np.nan
+        row[column][0, condStats['cue']] = condStats[column]
+    row['count'][0, condStats['cue']] = condStats['count']
+    return row
+
+def _writeSummary(rows, code):
+    '''
+    Writes the given SUMMARY_DTYPE rows and the hash of the code they were computed with to
+    summaryPath(), leaving the old table if that fails.
+    '''
+    path = summaryPath()
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, version=SUMMARY_VERSION, code=code, rows=rows)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+
+def _summaryCodeHash():
+    '''
+    Returns the sha1 hex digest of the code the summary rows are computed with: subjectSummary, the
+    functions of this module it screens the trials with and the sessionData and trialTable modules
+    behind them. Edits to any other code (such as the plots or the __main__ block) keep the rows.
+    '''
+    digest = hashlib.sha1()
+    for func in (subjectSummary, _screenedBreaks, oriTaskStats):
+        digest.update(inspect.getsource(func))
+    for module in (sessionData, inspect.getmodule(groupStats)):
+        with open(inspect.getsourcefile(module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+@PROFILER.profiled('summaryTable')
+def summaryTable(ids):
+    '''
+    Returns the SUMMARY_DTYPE rows of the subjects with the given ids, in order. The rows are kept in
+    summaryPath() and only computed (over WORKERS processes) for session files that were added or
+    whose size or modification time changed since, in which case the stored table is updated. The
+    whole table is recomputed when the code the rows are computed with (see _summaryCodeHash) changed.
+    '''
+    stored = {}
+    code = _summaryCodeHash()
+    try:
+        with np.load(summaryPath()) as f:
+            if int(f['version']) == SUMMARY_VERSION and str(f['code']) == code:
+                stored = dict((row['id'], row) for row in f['rows'])
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    stale = []
+    for id in ids:
+        stat = os.stat(subjectFile(id))
+        row = stored.get(id)
+        if row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime:
+            stale.append((id, stat))
+    if stale:
+        for (id, stat), row in zip(stale, mapSubjects(subjectSummary, [id for id, stat in stale])):
+            row['id'], row['size'], row['mtime'] = id, stat.st_size, stat.st_mtime
+            stored[id] = row[0]
+        _writeSummary(np.array([stored[id] for id in sorted(stored)], dtype=SUMMARY_DTYPE), code)
+    return np.array([stored[id] for id in ids], dtype=SUMMARY_DTYPE)
+
+def cueEffects(byCue):
+    '''
+    Returns the normalized favorite and least favorite cue effects (opposite minus cued, over their
+    mean) of the given subjects x CUE_CONDITIONS accuracies or response times.
+    '''
+    leastFavOpp, leastFavSame, favOpp, favSame = np.asarray(byCue).T
+    return (favOpp - favSame) / (favOpp + favSame) * 2, (leastFavOpp - leastFavSame) / (leastFavOpp + leastFavSame) * 2
+
+def _plotAxes(fig):
+    '''
+    Returns new axes on the given figure, cleared of everything drawn on it before so that no axes
+    or label state carries over from the last plot, or the axes of a new figure if fig is None.
+    '''
+    if fig is None:
+        return plt.subplots()[1]
+    fig.clf()
+    return fig.add_subplot(111)
+
+def _saveAxes(ax, path):
+    '''Saves the figure of the given axes, closing it unless it belongs to the batch renderer.'''
+    with PROFILER.stage('savefig'):
+        ax.figure.savefig(path, dpi=100)
+    if ax.figure not in _batchFigures:
+        plt.close(ax.figure)
+
+def plotST(inFile, outDir, fig=None):
     '''
     Saves a bar chart of the mean suppression times for each color, ordered from most favorite to least
-    favorite, from the given input file to the given output directory.
-    '''
-    bDict = breaksToDict(inFile, True)
-    pDict = prefsToDict(inFile, True)
-    colors, brkTimes, sds, prefs = [], [], [], []
-    for color in bDict.keys():
-        removeOutliers(bDict[color])
-        colors.append(color)
-        brkTimes.append(np.mean(bDict[color]))
-        sds.append(np.std(bDict[color]) / np.sqrt(len(bDict[color])))
-        prefs.append(pDict[color])
-    orderIndices = np.argsort(prefs)
-    xs = []
-    ys = []
-    errs = []
-    for ind in orderIndices:
-        xs.append(colors[ind])
-        ys.append(brkTimes[ind])
-        errs.append(sds[ind])
-    plt.subplots()[1].set_xticklabels([''] + xs)
-    plt.bar(range(6), ys, width=0.5, align='center')
-    plt.errorbar(range(6), ys, yerr=errs, ecolor='black', fmt='.')
-    plt.ylabel('Mean Suppression Time (s)')
-    plt.xlabel('Stimulus Color (RGB255)')
-    plt.title('Suppression Time By Color (Most to Least Favorite)')
-    plt.savefig(outDir + 'ST' + inFile[-6:-4] + '.png', dpi=100)
-    plt.close()
+    favorite, from the given input file to the given output directory. If given, the chart is drawn
+    on fig, which is cleared and left open for reuse (see renderAllFigures).
+    '''
+    session = loadSession(inFile)
+    trials = session.exp1
+    brkTimes, keep = _screenedBreaks(trials, True)
+    with PROFILER.stage('outliers'):
+        keep = outlierMask(trials, ('color',), brkTimes, threshold=OUTLIER_SDS, mask=keep)
+    byColor = groupStats(trials, ('color',), brkTimes, keep)
+    order = np.argsort(session.ranks[byColor['color']])
+    xs = [session.colors[color] for color in byColor['color'][order]]
+    ys, errs = byColor['mean'][order], byColor['sem'][order]
+    ax = _plotAxes(fig)
+    ax.set_xticklabels([''] + xs)
+    ax.bar(range(6), ys, width=0.5, align='center')
+    ax.errorbar(range(6), ys, yerr=errs, ecolor='black', fmt='.')
+    ax.set_ylabel('Mean Suppression Time (s)')
+    ax.set_xlabel('Stimulus Color (RGB255)')
+    ax.set_title('Suppression Time By Color (Most to Least Favorite)')
+    _saveAxes(ax, outDir + 'ST' + inFile[-6:-4] + '.png')
 
-def plotSThist(inFile, outDir):
+def plotSThist(inFile, outDir, fig=None):
     '''
-    Saves a line graph of the suppression time history (averaged into 6 bins) 
-    from the given input file to the given output directory.
+    Saves a line graph of the suppression time history (averaged into 30-trial bins) 
+    from the given input file to the given output directory, drawn on fig if given.
     '''
     ys = breaksHistory(inFile, True)
-    plt.plot(range(6), ys)
-    plt.title('Suppression Time Training Effect')
-    plt.ylim(0, 10)
-    plt.savefig(outDir + 'SThist' + inFile[-6:-4] + '.png', dpi=100)
-    plt.close() 
+    ax = _plotAxes(fig)
+    ax.plot(range(len(ys)), ys)
+    ax.set_title('Suppression Time Training Effect')
+    ax.set_ylim(0, 10)
+    _saveAxes(ax, outDir + 'SThist' + inFile[-6:-4] + '.png')
     
+def rankMeansST(ids):
+    '''
+    Returns a 6 x len(ids) array of the mean suppression times (including trials that became
+    definitely visible) of each preference rank, from most to least favorite, for each given subject.
+    '''
+    return summaryTable(ids)['rankST'].T
+
 def plotCombinedST(outDir):
     '''Saves a bar chart of the mean suppression times for each rank of preference across all subjects.'''
-    data = [[], [], [], [], [], []]
-    norms = []
-    for id in SUBJECTS:
-        inFile = '/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt'
-        bDict = breaksToDict(inFile, True)
-        pDict = prefsToDict(inFile, False)
-        for i in range(6):
-            #data[i] += bDict[pDict[i + 1]]
-            data[i].append(np.mean(bDict[pDict[i + 1]]))
-        norms.append((np.mean(bDict[pDict[1]]) - np.mean(bDict[pDict[6]]))/ (np.mean(bDict[pDict[1]]) + np.mean(bDict[pDict[6]])) * 2)
-    errs = []
-    for i in range(6):
-        errs.append(np.std(data[i]) / np.sqrt(len(data[i])))
-    print stats.f_oneway(data[0], data[1], data[2], data[3], data[4], data[5])
-    print stats.ttest_rel(norms, np.zeros(len(norms)))
-    for i, lst in enumerate(data):
-        data[i] = np.mean(lst)
+    data = rankMeansST(SUBJECTS)
+    norms = (data[0] - data[5]) / (data[0] + data[5]) * 2
+    errs = np.std(data, axis=1) / np.sqrt(len(SUBJECTS))
+    with PROFILER.stage('statistics'):
+        log.info('ANOVA across ranks: %s', stats.f_oneway(*data))
+        log.info('Normalized suppression time effect: %s', stats.ttest_rel(norms, np.zeros(len(norms))))
+        log.info('Resampled: %s', effectInference({'normST': norms}, seed=RESAMPLE_SEED))
+    data = np.mean(data, axis=1)
     plt.subplots()[1].set_xticklabels(['', '1st Fav.', '2nd Fav.', '3rd Fav.', '4th Fav.', '5th Fav.', '6th Fav.'])
     plt.bar(range(6), data, width=0.5, align='center')
     plt.errorbar(range(6), data, yerr=errs, ecolor='black', fmt='.')
     plt.ylabel('Mean Suppression Time (s)')
     plt.xlabel('Preference Ranking')
     plt.title('Suppression Time By Preference')
-    plt.savefig(outDir + 'STcombined.png', dpi=100)
+    with PROFILER.stage('savefig'):
+        plt.savefig(outDir + 'STcombined.png', dpi=100)
     plt.close()
         
 def plotCombinedSTDiff(outDir):
@@ -371,45 +402,40 @@ def plotCombinedSTDiff(outDir):
     Saves a bar chart of the mean suppression time differences (from the mean suppression time of the favorite color)
     for each rank of preference across all subjects into the given output directory.
     '''
-    data = [[], [], [], [], [], []]
-    norms = []
-    for id in SUBJECTS:
-        inFile = '/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt'
-        bDict = breaksToDict(inFile, True)
-        pDict = prefsToDict(inFile, False)
-        data[0].append(0)
-        for i in range(1, 6):
-            #data[i] += bDict[pDict[i + 1]]
-            data[i].append((np.mean(bDict[pDict[i + 1]]) - np.mean(bDict[pDict[1]])) / np.mean(bDict[pDict[1]]) * 100)
-        norms.append((np.mean(bDict[pDict[1]]) - np.mean(bDict[pDict[6]]))/ (np.mean(bDict[pDict[1]]) + np.mean(bDict[pDict[6]])) * 2)
-    errs = []
-    for i in range(1, 6):
-        errs.append(np.std(data[i]) / np.sqrt(len(data[i])))
-    print stats.f_oneway(data[0], data[1], data[2], data[3], data[4], data[5])
-    print stats.ttest_rel(norms, np.zeros(len(norms)))
-    for i, lst in enumerate(data):
-        data[i] = np.mean(lst)
+    rankMeans = rankMeansST(SUBJECTS)
+    norms = (rankMeans[0] - rankMeans[5]) / (rankMeans[0] + rankMeans[5]) * 2
+    data = (rankMeans - rankMeans[0]) / rankMeans[0] * 100
+    errs = np.std(data[1:], axis=1) / np.sqrt(len(SUBJECTS))
+    with PROFILER.stage('statistics'):
+        log.info('ANOVA across ranks: %s', stats.f_oneway(*data))
+        log.info('Normalized suppression time effect: %s', stats.ttest_rel(norms, np.zeros(len(norms))))
+        log.info('Resampled: %s', effectInference({'normST': norms}, seed=RESAMPLE_SEED))
+    data = np.mean(data, axis=1)
     plt.subplots()[1].set_xticklabels(['', '2nd Fav.', '3rd Fav.', '4th Fav.', '5th Fav.', '6th Fav.'])
     plt.bar(range(5), data[1:], width=0.5, align='center')
     plt.errorbar(range(5), data[1:], yerr=errs, ecolor='black', fmt='.')
     plt.ylabel('Mean Suppression Time Difference (%)')
     plt.xlabel('Preference Ranking')
     plt.title('Suppression Time Difference from Favorite Color')
-    plt.savefig(outDir + 'STdiffCombined.png', dpi=100)
+    with PROFILER.stage('savefig'):
+        plt.savefig(outDir + 'STdiffCombined.png', dpi=100)
     plt.close()
     
+def hueStats(filename):
+    '''
+    Returns the RunningStats of the suppression times (including trials that became definitely
+    visible) of each of the 6 ranked hues, in rainbow order, of the given session file.
+    '''
+    session = loadSession(filename)
+    brkTimes, keep = _screenedBreaks(session.exp1, True)
+    colors = session.exp1['color']
+    keep &= session.ranks[colors] > 0
+    return RunningStats(6).add(brkTimes[keep], colors[keep])
+
 def plotSTbyHue(outDir):
     '''Saves a bar chart of the mean suppression times for each hue across all subjects.'''
-    data = [[], [], [], [], [], []]
-    for id in SUBJECTS:
-        tempDict = breaksToDict('/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt', True)
-        for i, color in enumerate(colorlist('/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt')):
-            data[i] += tempDict[color]   
-    errs = []
-    for i in range(6):
-        errs.append(np.std(data[i]) / np.sqrt(len(data[i])))
-    for i, lst in enumerate(data):
-        data[i] = np.mean(lst)
+    byHue = mergeAll(mapSubjects(hueStats, SUBJECTS))
+    data, errs = byHue.mean, byHue.sem()
     
     plt.subplots()[1].set_xticklabels(['', 'red', 'orange', 'yellow', 'green', 'blue', 'purple'])
     plt.bar(range(6), data, width=0.5, align='center')
@@ -417,34 +443,37 @@ def plotSTbyHue(outDir):
     plt.ylabel('Mean Suppression Time (s)')
     plt.xlabel('Stimulus Hue')
     plt.title('Suppression Time By Hue')
-    plt.savefig(outDir + 'STcombinedHue.png', dpi=100)
+    with PROFILER.stage('savefig'):
+        plt.savefig(outDir + 'STcombinedHue.png', dpi=100)
     plt.close()
     
-def plotCH(inFile, outDir):
+def plotCH(inFile, outDir, fig=None):
     '''
     Saves a double line graph of the calibration history of both staircases
-    from the given input file to the given output directory.
+    from the given input file to the given output directory, drawn on fig if given.
     '''
     y1s, y2s = calibrationHistory(inFile)
-    plt.plot(range(len(y1s)), y1s)
-    plt.plot(range(len(y2s)), y2s)
-    plt.title('Tilt Magnitude History During Calibration')
-    plt.ylabel('Tilt Magnitude (degrees)')
-    plt.xlabel('Trial # (for the staircase)')
-    plt.savefig(outDir + 'calibHist' + inFile[-6:-4] + '.png', dpi=100)
-    plt.close()
+    ax = _plotAxes(fig)
+    ax.plot(range(len(y1s)), y1s)
+    ax.plot(range(len(y2s)), y2s)
+    ax.set_title('Tilt Magnitude History During Calibration')
+    ax.set_ylabel('Tilt Magnitude (degrees)')
+    ax.set_xlabel('Trial # (for the staircase)')
+    _saveAxes(ax, outDir + 'calibHist' + inFile[-6:-4] + '.png')
     
-def plotOA(inFile, outDir):
+def plotOA(inFile, outDir, fig=None):
     '''
     Saves a bar chart of the orientation task accuracies for the four relevant trial categories
-    from the given input file to the given output directory.
+    from the given input file to the given output directory, drawn on fig if given.
     '''
-    accData =  oriTaskAcc(inFile, False)
-    pDict = prefsToDict(inFile, False)
+    session = loadSession(inFile)
+    accData =  oriTaskAcc(session, False)
+    pDict = prefsToDict(session, False)
     leastFavColor, favColor = pDict[6], pDict[1]
     barLabels = [leastFavColor + ' opposite', leastFavColor + ' cued', favColor + ' opposite', favColor + ' cued']
     ys = (accData['leastFavOpp'], accData['leastFavSame'], accData['favOpp'], accData['favSame'])
-    barList = plt.bar(range(4), ys, align='center')
+    ax = _plotAxes(fig)
+    barList = ax.bar(range(4), ys, align='center')
     leastFavColor, favColor = leastFavColor[1:-1].split(','), favColor[1:-1].split(',')
     for i in range(3):
         leastFavColor[i] = float(leastFavColor[i]) / 180
@@ -453,43 +482,43 @@ def plotOA(inFile, outDir):
     barList[1].set_color(leastFavColor)
     barList[2].set_color(favColor)
     barList[3].set_color(favColor)
-    plt.xticks(range(4), barLabels, rotation=10)
-    plt.ylabel('Proportion of Correct Responses')
-    plt.title('Orientation Task Accuracy with Unconscious Cueing')
-    plt.savefig(outDir + 'OA' + inFile[-6:-4] + '.png', dpi=100)
-    plt.close()
+    ax.set_xticks(range(4))
+    ax.set_xticklabels(barLabels, rotation=10)
+    ax.set_ylabel('Proportion of Correct Responses')
+    ax.set_title('Orientation Task Accuracy with Unconscious Cueing')
+    _saveAxes(ax, outDir + 'OA' + inFile[-6:-4] + '.png')
   
+def _logCueTests(favCueEffect, leastFavCueEffect, prefEffect):
+    '''Logs the t-tests against zero and the resampling inference of the given per-subject cue effects.'''
+    effects = {'favCueEffect': favCueEffect, 'leastFavCueEffect': leastFavCueEffect, 'prefEffect': prefEffect}
+    with PROFILER.stage('statistics'):
+        for name in ('favCueEffect', 'leastFavCueEffect', 'prefEffect'):
+            log.info('%s: %s', name, stats.ttest_rel(effects[name], np.zeros(len(effects[name]))))
+        log.info('Resampled: %s', effectInference(effects, seed=RESAMPLE_SEED))
+
 def plotCombinedOA(validSubjects, outDir):
     '''
     Saves a bar chart of the orientation task accuracies for the four relevant trial categories
     across the given subjects to the given output directory.
     '''
-    ys = np.zeros((4, 1))
-    favCueEffect = []
-    leastFavCueEffect = []
-    for id in validSubjects:
-        accData = oriTaskAcc('/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt', False)
-        orderedData = (accData['leastFavOpp'], accData['leastFavSame'], accData['favOpp'], accData['favSame'])
-        favCueEffect.append((accData['favOpp'] - accData['favSame']) / (accData['favOpp'] + accData['favSame']) * 2)
-        leastFavCueEffect.append((accData['leastFavOpp'] - accData['leastFavSame']) / (accData['leastFavOpp'] + accData['leastFavSame']) * 2)
-        for i in range(4):
-            ys[i] += orderedData[i] / len(validSubjects)
-    print 'Fav: ' + str(np.mean(favCueEffect))
-    print 'leastFav: ' + str(np.mean(leastFavCueEffect))
+    byCue = summaryTable(validSubjects)['accuracy']
+    favCueEffect, leastFavCueEffect = cueEffects(byCue)
+    ys = np.mean(byCue, axis=0)
+    log.info('Fav: %s', np.mean(favCueEffect))
+    log.info('leastFav: %s', np.mean(leastFavCueEffect))
     prefEffect = np.array(favCueEffect) - np.array(leastFavCueEffect)
     plt.bar(range(len(favCueEffect)), favCueEffect)
     plt.close()
-    print ys
-    print stats.ttest_rel(favCueEffect, np.zeros(len(favCueEffect)))
-    print stats.ttest_rel(leastFavCueEffect , np.zeros(len(leastFavCueEffect)))
-    print stats.ttest_rel(prefEffect , np.zeros(len(prefEffect)))
+    log.info('Mean accuracy by cue condition: %s', ys)
+    _logCueTests(favCueEffect, leastFavCueEffect, prefEffect)
     barLabels = ('Least Fav. Distract', 'Least Fav. Cue', 'Fav. Distract', 'Fav. Cue')
     barList = plt.bar(range(4), ys, align='center')
     plt.xticks(range(4), barLabels, rotation=10)
     plt.ylim(0.5, 1.0)
     plt.ylabel('Proportion of Correct Responses')
     plt.title('Orientation Task Accuracy with Unconscious Cueing')
-    plt.savefig(outDir + 'OAcombined.png', dpi=100)
+    with PROFILER.stage('savefig'):
+        plt.savefig(outDir + 'OAcombined.png', dpi=100)
     plt.close()
     
 def plotCombinedOS(validSubjects, outDir):
@@ -497,61 +526,60 @@ def plotCombinedOS(validSubjects, outDir):
     Saves a bar chart of the orientation task reaction times for the four relevant trial categories
     across the given subjects to the given output directory.
     '''
-    ys = np.zeros((4, 1))
-    favCueEffect = []
-    leastFavCueEffect = []
-    for id in validSubjects:
-        accData = oriTaskSpd('/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt')
-        orderedData = (accData['leastFavOpp'], accData['leastFavSame'], accData['favOpp'], accData['favSame'])
-        favCueEffect.append((accData['favOpp'] - accData['favSame']) / (accData['favOpp'] + accData['favSame']) * 2)
-        leastFavCueEffect.append((accData['leastFavOpp'] - accData['leastFavSame']) / (accData['leastFavOpp'] + accData['leastFavSame']) * 2)
-        for i in range(4):
-            ys[i] += orderedData[i] / len(validSubjects)
-    print 'Fav: ' + str(np.mean(favCueEffect))
-    print 'leastFav: ' + str(np.mean(leastFavCueEffect))
-    print ys
+    byCue = summaryTable(validSubjects)['meanRT']
+    favCueEffect, leastFavCueEffect = cueEffects(byCue)
+    ys = np.mean(byCue, axis=0)
+    log.info('Fav: %s', np.mean(favCueEffect))
+    log.info('leastFav: %s', np.mean(leastFavCueEffect))
+    log.info('Mean response time by cue condition: %s', ys)
     prefEffect = np.array(favCueEffect) - np.array(leastFavCueEffect)
-    print stats.ttest_rel(favCueEffect, np.zeros(len(favCueEffect)))
-    print stats.ttest_rel(leastFavCueEffect , np.zeros(len(leastFavCueEffect)))
-    print stats.ttest_rel(prefEffect , np.zeros(len(prefEffect)))
+    _logCueTests(favCueEffect, leastFavCueEffect, prefEffect)
     barLabels = ('Least Fav. Distract', 'Least Fav. Cue', 'Fav. Distract', 'Fav. Cue')
     barList = plt.bar(range(4), ys, align='center')
     plt.xticks(range(4), barLabels, rotation=10)
     plt.ylabel('Proportion of Correct Responses')
     plt.title('Orientation Task Speed with Unconscious Cueing')
-    plt.savefig(outDir + 'OScombined.png', dpi=100)
+    with PROFILER.stage('savefig'):
+        plt.savefig(outDir + 'OScombined.png', dpi=100)
     plt.close()
 
+def effectStrengths(filename):
+    '''
+    Returns a tuple of the normalized preference effects of the given session file on suppression
+    time (first experiment) and on cue strength measured by response time (second experiment).
+    '''
+    session = loadSession(filename)
+    bDict = breaksToDict(session, True)
+    pDict = prefsToDict(session, False)
+    favNormST, leastFavNormST = np.mean(bDict[pDict[1]]), np.mean(bDict[pDict[6]])
+    accData = oriTaskSpd(session)
+    return ((favNormST - leastFavNormST) / (favNormST + leastFavNormST) * 2,
+            (accData['favOpp'] - accData['favSame']) / (accData['favOpp'] + accData['favSame']) * 2 -             
+            (accData['leastFavOpp'] - accData['leastFavSame']) / (accData['leastFavOpp'] + accData['leastFavSame']) * 2)
+
 def plotEffectCorr(validSubjects, outDir):
-    xs, ys = [], []
-    for id in validSubjects:
-        if id in SUBJECTS:
-            inFile = '/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt'
-            bDict = breaksToDict(inFile, True)
-            pDict = prefsToDict(inFile, False)
-            favNormST, leastFavNormST = np.mean(bDict[pDict[1]]), np.mean(bDict[pDict[6]])
-            xs.append((favNormST - leastFavNormST) / (favNormST + leastFavNormST) * 2)
-            accData = oriTaskSpd(inFile)
-            ys.append((accData['favOpp'] - accData['favSame']) / (accData['favOpp'] + accData['favSame']) * 2 -             
-                      (accData['leastFavOpp'] - accData['leastFavSame']) / (accData['leastFavOpp'] + accData['leastFavSame']) * 2)                
+    table = summaryTable([id for id in validSubjects if id in SUBJECTS])
+    favCueEffect, leastFavCueEffect = cueEffects(table['meanRT'])
+    xs, ys = table['normST'], favCueEffect - leastFavCueEffect
     plt.scatter(xs, ys)
-    s, intercept, Rval, pval, stdErr = stats.linregress(xs, ys)
+    with PROFILER.stage('statistics'):
+        s, intercept, Rval, pval, stdErr = stats.linregress(xs, ys)
+        log.info('Resampled: %s', correlationInference(xs, ys, seed=RESAMPLE_SEED))
     plt.text(-0.15, .15, 'R = ' + str(Rval) + '\np = ' + str(pval))
     plt.xlabel('Preference Effect on Suppression Time (Normalized)')
     plt.ylabel('Preference Effect on Cue Strength (Normalized)')
     plt.title('Experiment 1 vs. Experiment 2 Effect Strength')
-    plt.savefig(outDir + 'ECspeed.png', dpi=100)
+    with PROFILER.stage('savefig'):
+        plt.savefig(outDir + 'ECspeed.png', dpi=100)
     plt.close()
     
 def accOutliers(validSubjects, stdevs):
     accs = {'favSame':[], 'favOpp':[], 'leastFavSame':[], 'leastFavOpp':[]}
-    avgAccs = []
+    byCue = summaryTable(validSubjects)['meanRT']
+    for cond in accs.keys():
+        accs[cond] = byCue[:, CUE_CONDITIONS.index(cond)].tolist()
+    avgAccs = np.mean(byCue, axis=1).tolist()
     output = []
-    for id in validSubjects:
-        accData = oriTaskSpd('/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt')
-        for cond in accs.keys():
-            accs[cond].append(accData[cond])
-        avgAccs.append(np.mean(accData.values()))
     for cond in accs.keys():
         lower = np.mean(accs[cond]) - stdevs * np.std(accs[cond])
         upper = np.mean(accs[cond]) + stdevs * np.std(accs[cond])
@@ -564,26 +592,138 @@ def accOutliers(validSubjects, stdevs):
         if avgAccs[i] < lower or avgAccs[i] > upper and validSubjects[i] not in output:
             output.append(validSubjects[i])
     return output
+
+def exclusionSensitivity(ids, maxExcluded=1):
+    '''
+    Returns the sensitivityTable of the ANOVA of the suppression times across ranks, the t-tests of
+    the normalized suppression time effect and of the cue effects on accuracy, and the correlation
+    of plotEffectCorr, over every subset of the given subjects that leaves out at most maxExcluded
+    of them, from the summaryTable of the subjects, who need both experiments.
+    '''
+    table = summaryTable(ids)
+    favCueEffect, leastFavCueEffect = cueEffects(table['accuracy'])
+    favSpeedEffect, leastFavSpeedEffect = cueEffects(table['meanRT'])
+    tests = {'rankST': ('anova', table['rankST'].T),
+             'normST': ('ttest', table['normST']),
+             'favCueEffect': ('ttest', favCueEffect),
+             'leastFavCueEffect': ('ttest', leastFavCueEffect),
+             'prefEffect': ('ttest', favCueEffect - leastFavCueEffect),
+             'effectCorr': ('corr', (table['normST'], favSpeedEffect - leastFavSpeedEffect))}
+    return sensitivityTable(ids, tests, maxExcluded)
+
+SUBJECT_PLOTS = (plotST, plotSThist, plotCH, plotOA)
+_batchFigures = []  # the one figure each batch rendering process draws all its plots on
+
+def renderSubjectFigures(inFile, outDir):
+    '''Saves all the per-subject figures of the given input file, reusing this process's batch figure.'''
+    if not _batchFigures:
+        _batchFigures.append(plt.figure())
+    for plot in SUBJECT_PLOTS:
+        with PROFILER.stage(plot.__name__):
+            plot(inFile, outDir, _batchFigures[0])
+    return inFile
+
+def _analysisSources():
+    '''
+    Returns the source files of the analysis code, which every figure depends on: this module and
+    every module next to it whose modules, functions or classes it imports, directly or through
+    one another, so that a new helper module is picked up without being listed.
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    modules, pending = set(), [sys.modules[__name__]]
+    while pending:
+        module = pending.pop()
+        modules.add(module)
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                used = value
+            elif inspect.isfunction(value) or inspect.isclass(value):
+                used = inspect.getmodule(value)
+            else:
+                continue
+            path = getattr(used, '__file__', None)
+            if used not in modules and path and os.path.dirname(os.path.abspath(path)) == here:
+                pending.append(used)
+    return sorted(inspect.getsourcefile(module) for module in modules)
+
+def subjectOutputs(id):
+    '''Returns the names of the per-subject figures of the subject with the given id.'''
+    return [prefix + id + '.png' for prefix in ('ST', 'SThist', 'calibHist', 'OA')]
+
+def renderAllFigures(outDir, validSubjects, workers=None, force=False):
+    '''
+    Saves the per-subject figures of every subject and then the combined figures to the given output
+    directory without a display. The per-subject figures are rendered over the given number of
+    worker processes (None for one per core); validSubjects are used by the orientation task figures.
+    Figures whose session files, subject lists, outlier setting and analysis code are unchanged since
+    they were last rendered into outDir are skipped unless force is True. Returns the rebuilt targets.
+    '''
+    plt.switch_backend('Agg')
+    build = FigureBuild(outDir)
+    code = _analysisSources()
+    params = {'outlierSDs': OUTLIER_SDS}
+    effectSubjects = [id for id in validSubjects if id in SUBJECTS]
+    combined = [('STcombined', plotCombinedST, (outDir,), 'STcombined.png', SUBJECTS),
+                ('STdiffCombined', plotCombinedSTDiff, (outDir,), 'STdiffCombined.png', SUBJECTS),
+                ('STcombinedHue', plotSTbyHue, (outDir,), 'STcombinedHue.png', SUBJECTS),
+                ('OAcombined', plotCombinedOA, (validSubjects, outDir), 'OAcombined.png', validSubjects),
+                ('OScombined', plotCombinedOS, (validSubjects, outDir), 'OScombined.png', validSubjects),
+                ('ECspeed', plotEffectCorr, (validSubjects, outDir), 'ECspeed.png', effectSubjects)]
+    rebuilt = []
+    try:
+        stale = [id for id in SUBJECTS if force or not build.isCurrent('subject' + id, subjectOutputs(id),
+                                                                        [subjectFile(id)] + code, params)]
+        _subjectMap(renderSubjectFigures, [(subjectFile(id), outDir) for id in stale], workers)
+        for id in stale:
+            build.record('subject' + id, subjectOutputs(id), [subjectFile(id)] + code, params)
+            rebuilt.append('subject' + id)
+        for target, plot, args, output, ids in combined:
+            inputs = [subjectFile(id) for id in ids] + code
+            targetParams = dict(params, subjects=ids)
+            if force or not build.isCurrent(target, [output], inputs, targetParams):
+                with PROFILER.stage(plot.__name__):
+                    plot(*args)
+                build.record(target, [output], inputs, targetParams)
+                rebuilt.append(target)
+    finally:
+        build.save()
+    return rebuilt
     
 if __name__ == '__main__':
-    inFile = '/home/shimojolab/PsychopyExperiments/colorPrefData/expData27.txt'
+    inFile = subjectFile('27')
     outDir = '/home/shimojolab/PsychopyExperiments/colorPrefFigures/'
+    validSubjects = ['01', '02', '04', '06', '10', '12', '16', '18', '20', '21', '22', '23', '25', '26', '27']  # those with satisfactory calibration
+    # --verbose also logs the per-subject details, and --profile report.json (or .csv) writes the
+    # time, calls, bytes read and peak memory of every stage and subject of the run to the report
+    args = [arg for arg in sys.argv[1:] if arg not in ('--verbose', '--force')]
+    logging.basicConfig(level=logging.DEBUG if '--verbose' in sys.argv else logging.INFO, format='%(message)s')
+    if '--profile' in args:
+        i = args.index('--profile')
+        if i + 1 == len(args) or args[i + 1].startswith('--'):
+            sys.exit('usage: python colorPreferenceAnalysis.py [--all [outDir]] [--force] [--verbose] '
+                     '[--profile report.json|report.csv]')
+        atexit.register(PROFILER.enable().writeReport, args[i + 1])
+        del args[i:i + 2]
+    if args[:1] == ['--all']:
+        # python colorPreferenceAnalysis.py --all [outDir] [--force] renders every out-of-date figure headlessly
+        print renderAllFigures(args[1] if args[1:] else outDir, validSubjects, force='--force' in sys.argv)
+        sys.exit()
     plotST(inFile, outDir)
     plotOA(inFile, outDir)
     plotCH(inFile, outDir)
 
     plotCombinedSTDiff(outDir)
     for id in SUBJECTS:
-        inFile = '/home/shimojolab/PsychopyExperiments/colorPrefData/expData' + id + '.txt'
+        inFile = subjectFile(id)
         #plotST(inFile, outDir)
         #plotSThist(inFile, outDir)
     #plotSTbyHue(outDir)
     # 4, 16, 18, 26
-    validSubjects = ['01', '02', '04', '06', '10', '12', '16', '18', '20', '21', '22', '23', '25', '26', '27']  # those with satisfactory calibration
     #plotCombinedOA(validSubjects, outDir)
     #plotCombinedOS(validSubjects, outDir)
     #plotEffectCorr(validSubjects, outDir)
     #print accOutliers(validSubjects, 3)
+    #print exclusionSensitivity([id for id in validSubjects if id in SUBJECTS], 2)
         
 
         
@@ -1,8 +1,16 @@
 from psychopy import visual, core, event
 import singleColorCross as crss
+from gratingTextures import cachedTexture, precomputeTextures, staircaseTilts
+from stimulusPlans import breakingTimePlan, primePlan
+from frameTiming import TimingLog, ResponseLog, timingPath, responsePath, flipLockedRT
+from trialWriter import TrialWriter
 import numpy as np
 import random
 import time
+try:
+    from psychopy.hardware import keyboard  # timestamps keypresses as they happen (psychtoolbox backend)
+except ImportError:  # older psychopy, keypresses are timestamped when the event queue is polled
+    keyboard = None
 
 '''
 TODO: finalize calibration procedure -- should it be 4x6 or 4x8 or still 2x10?
@@ -10,15 +18,20 @@ TODO: finalize calibration procedure -- should it be 4x6 or 4x8 or still 2x10?
 
 PATH_TO_MONDRIANS = 'Mondrians/newColors/'
 PATH_TO_STIMULI = 'ColorStimuli/'
-OUTPUT_FILE = open('colorPrefData/expData27.txt', 'a')
+OUTPUT_FILE = TrialWriter('colorPrefData/expData27.txt')  # written from a background thread
 CENTER_DIST = -0.33  # positive for right-eye dominant, negative for left-eye dominant
 YPOS = 0.1
 LEFT_SHIFT = -0.055
 TEXT_SIZE = 0.038
 REFRESH_RATE = 60  # in Hz
+RECORD_FRAME_TIMING = False  # write the flip timing of every trial to the timing file next to OUTPUT_FILE
+RECORD_RESPONSE_TIMES = True  # write the flip-locked response times to the response file next to OUTPUT_FILE
 FIRST_STAGE_REPETITIONS = 15 # per color + side combination
 SECOND_STAGE_REPETITIONS = 10  # per layout 
 STAIRCASE_REVERSALS = 12
+MAX_STAIRCASE_TILT = 10.0  # textures of staircase tilts up to this many degrees are precomputed
+TIMING_LOG = TimingLog(TrialWriter(timingPath(OUTPUT_FILE.name)), REFRESH_RATE) if RECORD_FRAME_TIMING else None
+RESPONSE_LOG = ResponseLog(TrialWriter(responsePath(OUTPUT_FILE.name))) if RECORD_RESPONSE_TIMES else None
 
 colorsToTest = [(27, 0, 0), (12, 6, 0), (8, 8, 0), (0, 10, 0), (0, 0, 90), (24, 0, 24)]
 tweak = 1.0
@@ -164,9 +177,36 @@ endMsg = visual.TextStim(win, height=TEXT_SIZE, wrapWidth=0.8, pos=(0, 0),
 def cleanExit():
     '''Properly exits the experiment.'''
     OUTPUT_FILE.close()
+    if RESPONSE_LOG:
+        RESPONSE_LOG.close()
+    if TIMING_LOG:
+        TIMING_LOG.close()
     win.close()
     core.quit()
 
+# Keypresses are timestamped on core.monotonicClock, the clock win.flip() returns its timestamps on
+# and reported when the key goes down (not on release), as the event module reports them
+responseKeyboard = keyboard.Keyboard() if keyboard else None
+
+def clearPresses():
+    '''Discards the keypresses the low-latency keyboard has buffered (the event module has its own queue).'''
+    if responseKeyboard:
+        responseKeyboard.clearEvents()
+
+def getPresses(keyList):
+    '''Returns (key, time) of every press of the given keys since the last call, without waiting.'''
+    if responseKeyboard:
+        return [(key.name, key.tDown - core.monotonicClock.getLastResetTime())
+                for key in responseKeyboard.getKeys(keyList=keyList, waitRelease=False)]
+    return event.getKeys(keyList=keyList, timeStamped=core.monotonicClock)
+
+def waitPress(keyList):
+    '''Waits for a press of one of the given keys and returns (key, time) of it.'''
+    if hasattr(responseKeyboard, 'waitKeys'):  # not in the first releases of psychopy.hardware.keyboard
+        key = responseKeyboard.waitKeys(keyList=keyList, waitRelease=False)[0]
+        return key.name, key.tDown - core.monotonicClock.getLastResetTime()
+    return event.waitKeys(keyList=keyList, timeStamped=core.monotonicClock)[0]
+
 def drawBackground():
     '''Draws the boxes and the fixation points for each eye's view .'''
     leftBox.draw()
@@ -200,8 +240,11 @@ def waitForReady(isSecondStage):
     if input[0] == 'escape':
         cleanExit()
 
-def askForLocation(loc, isSecondStage):
-    '''Draws the question for the location task and waits for subject to answer.'''
+def askForLocation(loc, isSecondStage, pressTimes=None):
+    '''
+    Draws the question for the location task and waits for subject to answer.
+    The timestamp of the answer is appended to pressTimes if given.
+    '''
     drawBackground()
     choicesL.text = 'Left (L)       Right (R)'
     choicesR.text = 'Left (L)       Right (R)'
@@ -213,8 +256,10 @@ def askForLocation(loc, isSecondStage):
     questionR.draw()
     choicesR.draw()
     win.flip()  
-    answer = event.waitKeys(keyList=['left', 'right'])
-    return (answer[0] == 'left' and loc < 0) or (answer[0] == 'right' and loc > 0)    
+    answer, pressTime = waitPress(['left', 'right'])
+    if pressTimes is not None:
+        pressTimes.append(pressTime)
+    return (answer == 'left' and loc < 0) or (answer == 'right' and loc > 0)    
     
 def circleBreakingTime(color, stimLoc, askLocation, blinking):
     '''
@@ -225,42 +270,42 @@ def circleBreakingTime(color, stimLoc, askLocation, blinking):
     stim.color = color
     stim.pos = (-CENTER_DIST + stimLoc, YPOS + LEFT_SHIFT)
     waitForReady(False)
+    clearPresses()
     fixTime = np.random.randint(0, REFRESH_RATE)
     for frameN in range(fixTime):
         drawBackground()
         win.flip()
-    mondN = 0
     breakingTime = 99999
+    flipRT = 99999
+    pressTime = None
+    flipTimes = []
     startTime = time.time()
-    for frameN in range(int(10.8 * REFRESH_RATE)):  # want to allow up to 10 seconds, last display is for finding bad subjects
-        if frameN <= 3.0 * REFRESH_RATE:
-            stim.opacity = frameN / (3.0 * REFRESH_RATE)
+    # want to allow up to 10 seconds, last display is for finding bad subjects
+    for mondN, opacity, drawMondrians, drawStim in breakingTimePlan(REFRESH_RATE, blinking).tolist():
+        stim.opacity = opacity
         drawBackground()
-        if int(frameN % (REFRESH_RATE / 10.0)) == 0:  # change mondrian 10 times per second
-            mondN += 1
-            if mondN > 9:  # there are 10 mondrians to cycle through
-                mondN = 0           
-        if blinking:
-            if frameN % int(REFRESH_RATE * 0.6) < REFRESH_RATE / 3.0 + 4:
-                if frameN < 10 * REFRESH_RATE:
-                    monds1[mondN].draw()
-                    monds2[mondN].draw()
-                if frameN % int(REFRESH_RATE * 0.6) >= 2 and frameN % int(REFRESH_RATE * 0.6) < REFRESH_RATE / 3.0 + 2:
-                    stim.draw()
-        else:
+        if drawMondrians:
+            monds1[mondN].draw()
+            monds2[mondN].draw()
+        if drawStim:
             stim.draw()
-            if frameN < 10 * REFRESH_RATE:
-                monds1[mondN].draw()
-                monds2[mondN].draw()
-        if event.getKeys(keyList=['space']):
+        presses = getPresses(['space'])
+        if presses:
             breakingTime = time.time() - startTime
-            win.flip()
+            pressTime = presses[0][1]
+            flipTimes.append(win.flip())
             break
-        win.flip()
+        flipTimes.append(win.flip())
+    if pressTime is not None:
+        flipRT = flipLockedRT(pressTime, flipTimes)  # from the first stimulus flip, EARLY_PRESS before it
     if askLocation:
         passedTask = askForLocation(stimLoc, False)   
-        print str(color) + ': ' + str(breakingTime) + ' seconds, test passed=' + str(passedTask)
-        OUTPUT_FILE.write(str(color).replace(' ', '') + ' ' + str(stimLoc) + ' ' + str(breakingTime) + ' ' + str(passedTask) + '\n')
+        OUTPUT_FILE.write(str(color).replace(' ', '') + ' ' + str(stimLoc) + ' ' + str(breakingTime) + ' ' + str(passedTask) + '\n',
+                          str(color) + ': ' + str(breakingTime) + ' seconds, test passed=' + str(passedTask))
+        if RESPONSE_LOG:
+            RESPONSE_LOG.write('breaking', breakingTime, flipRT)
+        if TIMING_LOG:
+            TIMING_LOG.write('breaking', flipTimes)
     event.clearEvents()   
     showConfirmation()
 
@@ -296,10 +341,8 @@ def recordPreference(colors):
                 ranksUsed += 1
             ranks[colorsToTest[current]].text = input[0]
         event.clearEvents()   
-    OUTPUT_FILE.write('preferences: ')
-    for color in colorsToTest:
-        OUTPUT_FILE.write(str(color).replace(' ', '') + str(ranks[color].text) + ' ')
-    OUTPUT_FILE.write('\n')
+    OUTPUT_FILE.write('preferences: ' + ''.join(str(color).replace(' ', '') + str(ranks[color].text) + ' '
+                                                for color in colorsToTest) + '\n')
     indicator.autoDraw = False
     for color in colorsToTest:
         circles[color].autoDraw = False
@@ -405,6 +448,7 @@ def equiluminanceAlt(color1, color2):
     sliderBar.autoDraw = False
     indicator.autoDraw = False
     OUTPUT_FILE.write('equiluminantColor: ' + str(temp2).replace(' ', '') + '\n') 
+    OUTPUT_FILE.sync()
     return (color1, temp2)
 
 def drawWarning(isSecondStage):
@@ -418,11 +462,14 @@ def drawWarning(isSecondStage):
     event.waitKeys(keyList=['x'])
     event.clearEvents()
     
-def ringPrime(stimColor, ringColor, popLoc):
+def ringPrime(stimColor, ringColor, popLoc, flipTimes=None):
     '''
     Presents a suppressed ring of 8 cross-circles as a prime. The top cross-circle is of a different color.
+    The timestamps of the flips are appended to flipTimes if given.
     DEPRECATED: Returns whether or not the subject indicated (by pressing space) that they saw the ring. 
     '''
+    if flipTimes is None:
+        flipTimes = []
     for mond in monds1:
         mond.size = (0.25, 0.25 * ASPECT_RATIO)
         mond.pos = (CENTER_DIST, YPOS)
@@ -431,19 +478,13 @@ def ringPrime(stimColor, ringColor, popLoc):
     stim.color = stimColor
     primingRing.colors = ringColor
     primingRing.fieldPos = (-CENTER_DIST, YPOS + LEFT_SHIFT)
-    mondN = 0
-    for frameN in range(int(2.3 * REFRESH_RATE)):  
-        if int(frameN % (REFRESH_RATE / 10.0)) == 0:  # change mondrian 10 times per second
-            mondN += 1            
-            if mondN > 9:  # there are 10 mondrians to cycle through
-                mondN = 0
-            #monds1[mondN].opacity = np.random.randint(70, 101) / 100.0
+    for mondN, opacity, drawMondrians, drawStim in primePlan(REFRESH_RATE).tolist():
+        #monds1[mondN].opacity = np.random.randint(70, 101) / 100.0
         drawBackground()
-        cycleProgress = frameN % int(REFRESH_RATE * 0.5)
-        if cycleProgress < REFRESH_RATE / 5 + 6:
+        if drawMondrians:
             monds1[mondN].draw()
-            if cycleProgress >= 3 and cycleProgress < REFRESH_RATE / 5 + 3:
-                stim.opacity = (cycleProgress - 2) / (REFRESH_RATE / 5.0 + .01)
+            if drawStim:
+                stim.opacity = opacity
                 primingRing.opacities = stim.opacity
                 #primingRing.draw()
                 stim.draw()
@@ -455,7 +496,7 @@ def ringPrime(stimColor, ringColor, popLoc):
             event.clearEvents()
             return True
         '''
-        win.flip()
+        flipTimes.append(win.flip())
     return False
 
 def askVisible():
@@ -529,46 +570,43 @@ def askColorSeen(color1, color2):
     answer = event.waitKeys(keyList=['left', 'right', 'space'])
     return answer[0]
 
-def rotatedSineTexture(degrees):
-    '''Returns numpy array of grating texture rotated from vertical by given amount of degrees.'''
-    tex1 = np.zeros((256, 256))
-    slope = np.arctan(degrees * np.pi / 180)  # gabor is rotated by degree amount in layout
-    for y in range(256):
-        for x in range(256):
-            dist = (-slope * (y - 128) + (x - 128)) / np.sqrt(1 + slope ** 2)
-            val1 = np.cos(dist * 2.0 * np.pi / 256 * 4)  # spatial frequency (sine periods)      
-            tex1[y][x] = val1
-    return tex1
-    
-def orientationTask(color1, color2, layout):  
+def orientationTask(color1, color2, layout, stair=None):  
     '''
     Runs a full trial of measuring the speed of performing an orientation task
     after a pop-out prime of the given colors at the location determined by
-    the given layout tuple. Writes results to output text file.
+    the given layout tuple. Writes results to output text file, starting the line
+    with the number of the calibration staircase if stair is given.
     
     Layout tuple format: 
     (color of the popout cross, location (top or bottom) of popout, location of gabor, clockwise tilt of gabor)
     '''
     gabor.pos = (-CENTER_DIST, YPOS + layout[2] + LEFT_SHIFT)
-    gabor.tex = rotatedSineTexture(layout[3]) 
+    gabor.tex = cachedTexture(layout[3])
     waitForReady(True)
+    primeFlips = []
     if layout[0] == 1:
-        primeVisible = ringPrime(color1, color2, layout[1])
+        primeVisible = ringPrime(color1, color2, layout[1], primeFlips)
     else:
-        primeVisible = ringPrime(color2, color1, layout[1])
+        primeVisible = ringPrime(color2, color1, layout[1], primeFlips)
     if not primeVisible:
+        gaborFlips = []
         startTime = time.time()
         for frameN in range(int(REFRESH_RATE * 2)):
             drawBackground()
             gabor.draw()
-            win.flip()
-        passedTask = askForLocation(layout[3], True) 
+            gaborFlips.append(win.flip())
+        pressTimes = []
+        passedTask = askForLocation(layout[3], True, pressTimes)
         responseTime = time.time() - startTime
         visibility = askVisible()
         visibleLoc = askLocationsSeen(bool(visibility))
-        OUTPUT_FILE.write(str(layout) + ' ' + str(responseTime) + ' ' + str(passedTask) + ' ' + str(visibility) + 
-                          ' ' + str(visibleLoc) + '\n')
-        print str(layout) + ' ' + str(responseTime) + ' ' + str(passedTask) + ' ' + str(visibility) + ' ' + str(visibleLoc)
+        record = str(layout) + ' ' + str(responseTime) + ' ' + str(passedTask) + ' ' + str(visibility) + ' ' + str(visibleLoc)
+        OUTPUT_FILE.write(('' if stair is None else str(stair) + ' ') + record + '\n', record)
+        if RESPONSE_LOG:
+            RESPONSE_LOG.write('gabor', responseTime, flipLockedRT(pressTimes[0], gaborFlips))
+        if TIMING_LOG:
+            TIMING_LOG.write('prime', primeFlips)
+            TIMING_LOG.write('gabor', gaborFlips)
         event.clearEvents()
     showConfirmation()
     return passedTask
@@ -579,7 +617,8 @@ def calibrateDifficulty(color1, color2, yDist):
     Staircases down from 5 degrees and then up from 1 degree, then averages results.
     '''
     class tiltStaircase:
-        def __init__(self, startTilt, isLowering):
+        def __init__(self, startTilt, isLowering, index):
+            self.index = index
             self.tilt = startTilt
             self.reversalsLeft = STAIRCASE_REVERSALS
             self.loweringTilt = isLowering
@@ -590,14 +629,15 @@ def calibrateDifficulty(color1, color2, yDist):
             self.reversalsLeft -= 1
             self.revTilts.append(self.tilt)
             self.correctStreak = 0
-            print str(self.reversalsLeft) + ' reversals left, ' + str(self.tilt) + ' degrees'
-            OUTPUT_FILE.write('REV' + str(STAIRCASE_REVERSALS - 1 - self.reversalsLeft) + '\n')
+            OUTPUT_FILE.write('REV' + str(STAIRCASE_REVERSALS - 1 - self.reversalsLeft) + '\n',
+                              str(self.reversalsLeft) + ' reversals left, ' + str(self.tilt) + ' degrees')
             
         def runTrial(self):
             popLoc = (np.random.randint(0, 2) - 0.5) * 2.0 * yDist
             gabLoc = (np.random.randint(0, 2) - 0.5) * 2.0 * yDist
             dir = (np.random.randint(0, 2) - 0.5) * 2.0
-            passedTask = orientationTask(color1, color2, (np.random.randint(1, 3), popLoc, gabLoc, self.tilt * dir))
+            passedTask = orientationTask(color1, color2, (np.random.randint(1, 3), popLoc, gabLoc, self.tilt * dir),
+                                         self.index)
             if passedTask:
                 self.correctStreak += 1
                 if self.correctStreak == 3:
@@ -614,19 +654,17 @@ def calibrateDifficulty(color1, color2, yDist):
                     self.loweringTilt = False
                     self.endReversal()
                     
+    precomputeTextures(staircaseTilts(MAX_STAIRCASE_TILT))
     OUTPUT_FILE.write('CALIB\n')
-    stair1 = tiltStaircase(6.0, True)
-    stair2 = tiltStaircase(1.0, False)
+    stair1 = tiltStaircase(6.0, True, 0)
+    stair2 = tiltStaircase(1.0, False, 1)
     while stair1.reversalsLeft > 0 or stair2.reversalsLeft > 0:
         if stair1.reversalsLeft == 0:
-            OUTPUT_FILE.write('1 ')
             stair2.runTrial()
         elif stair2.reversalsLeft == 0:
-            OUTPUT_FILE.write('0 ')
             stair1.runTrial()
         else:
             stair = np.random.randint(0, 2)
-            OUTPUT_FILE.write(str(stair) + ' ')
             if stair == 0:
                 stair1.runTrial()
             elif stair == 1:
@@ -641,6 +679,8 @@ def showEndMsg():
     
     
 if __name__ == '__main__':
+    if OUTPUT_FILE.torn:
+        print "Removed the unfinished last line of " + OUTPUT_FILE.name + ": " + repr(OUTPUT_FILE.torn)
     print "Running at " + str(win.size) + " resolution with refresh rate of " + str(win.getActualFrameRate()) + " Hz..."
     print "Conducting experiment 1 using the following colors: " + str(colorsToTest)
     OUTPUT_FILE.write('START1\n')
@@ -659,17 +699,21 @@ if __name__ == '__main__':
         circleBreakingTime(layouts[layoutN][0], layouts[layoutN][1], True, True)
         progress += 1
         if progress % 20 == 0:
-            print 'Trial ' + str(progress) + ' done'
+            OUTPUT_FILE.echo('Trial ' + str(progress) + ' done')
+            OUTPUT_FILE.sync()
     OUTPUT_FILE.write('END1\n')
+    OUTPUT_FILE.sync()
         
     drawWarning(False)
     extremes = recordPreference(colorsToTest)
     newColors = equiluminanceAlt(extremes[0], extremes[1])
-    print "Conducting experiment 2 using the following colors: " + str(newColors)
+    OUTPUT_FILE.echo("Conducting experiment 2 using the following colors: " + str(newColors))
     tiltMag = calibrateDifficulty(newColors[0], newColors[1], ringRadius)
-    print "Optimal tilt magnitude calibrated to be: " + str(tiltMag) + " degrees..."
+    OUTPUT_FILE.echo("Optimal tilt magnitude calibrated to be: " + str(tiltMag) + " degrees...")
+    precomputeTextures([-tiltMag, tiltMag])
     
     OUTPUT_FILE.write('START2\n')
+    OUTPUT_FILE.sync()
     # All possible trial configurations for second experiment
     layouts = []
     for popColor in [1, 2]:
@@ -687,8 +731,10 @@ if __name__ == '__main__':
         orientationTask(newColors[0], newColors[1], layouts[layoutN])
         progress += 1
         if progress % 20 == 0:
-            print 'Trial ' + str(progress) + ' done'
+            OUTPUT_FILE.echo('Trial ' + str(progress) + ' done')
+            OUTPUT_FILE.sync()
     OUTPUT_FILE.write('END2\n')
+    OUTPUT_FILE.sync()
     showEndMsg()
     
 # Global cleanup
@@ -0,0 +1,80 @@
+'''
+Make-style tracking of the figures rendered by colorPreferenceAnalysis.
+
+A manifest in the output directory records, for every target (a group of output files made by one
+call), the files and parameters it was built from and a signature of their contents. A target only
+needs rebuilding when that signature changes or one of its outputs is missing.
+'''
+import hashlib
+import json
+import os
+
+BUILD_VERSION = 1
+MANIFEST_NAME = '.figureBuild.json'
+
+def _contentHash(filename):
+    '''Returns the sha1 hex digest of the contents of the given file.'''
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class FigureBuild(object):
+    '''The build manifest of one output directory.'''
+
+    def __init__(self, outDir):
+        self.outDir = outDir
+        self.path = os.path.join(outDir, MANIFEST_NAME)
+        self.targets = {}  # target name -> {'outputs', 'inputs', 'params', 'signature'}
+        self.stamps = {}   # input file -> [size, mtime, sha1]
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == BUILD_VERSION:
+                self.targets, self.stamps = manifest['targets'], manifest['stamps']
+        except (IOError, OSError, ValueError):
+            pass
+
+    def fileHash(self, filename):
+        '''
+        Returns the sha1 of the contents of the given file, or None if it does not exist. The file
+        is only rehashed if its size or modification time changed since it was last hashed.
+        '''
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        stamp = self.stamps.get(filename)
+        if stamp is None or stamp[:2] != [stat.st_size, stat.st_mtime]:
+            stamp = [stat.st_size, stat.st_mtime, _contentHash(filename)]
+            self.stamps[filename] = stamp
+        return stamp[2]
+
+    def signature(self, inputs, params):
+        '''Returns a digest of the contents of the given input files and of the given parameters.'''
+        hashes = [[filename, self.fileHash(filename)] for filename in sorted(inputs)]
+        return hashlib.sha1(json.dumps([hashes, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def isCurrent(self, target, outputs, inputs, params):
+        '''
+        Returns whether the given target was last built from the same inputs and parameters and all
+        of its outputs (names within the output directory) still exist.
+        '''
+        record = self.targets.get(target)
+        return (record is not None and sorted(record['outputs']) == sorted(outputs)
+                and all(os.path.exists(os.path.join(self.outDir, output)) for output in outputs)
+                and record['signature'] == self.signature(inputs, params))
+
+    def record(self, target, outputs, inputs, params):
+        '''Records that the given target has just been built from the given inputs and parameters.'''
+        self.targets[target] = {'outputs': list(outputs), 'inputs': sorted(inputs), 'params': params,
+                                'signature': self.signature(inputs, params)}
+
+    def save(self):
+        '''Writes the manifest to the output directory.'''
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump({'version': BUILD_VERSION, 'targets': self.targets, 'stamps': self.stamps}, f,
+                      sort_keys=True, indent=1)
+        os.rename(tmpPath, self.path)
@@ -0,0 +1,115 @@
+'''
+Flip timing and flip-locked response times of the trials of color_preference_ST.py.
+
+The render loops keep the timestamp returned by every win.flip(). When frame timing is recorded, a
+TimingLog writes one line per stream of each trial to the timing file next to the session file
+(see timingPath): the stream's label ('breaking' for the Mondrian stream of circleBreakingTime,
+'prime' and 'gabor' for the prime and the gabor display of orientationTask), its number among
+the streams of that label so far in the session and the flipSummary of its flips. The numbers run
+on across sections: the n-th 'breaking' line belongs to the n-th trial line of the first
+experiment, and the n-th 'prime' and 'gabor' lines to the n-th orientation task trial line of
+the calibration and the second experiment taken together.
+
+A ResponseLog writes the response times of every trial to the response file next to the session
+file (see responsePath) in the same way, both as the session file has them (time.time() from just
+before the stream to the keypress being handled) and flip-locked (from the first flip of the stream
+to the timestamp of the keypress, on the clock of the flips). A keypress made before the first flip
+of its stream (such as one buffered during fixation) gets EARLY_PRESS as its flip-locked time.
+'''
+import numpy as np
+
+LATE_MARGIN = 0.5  # fraction of a refresh interval by which a flip may be late before it counts as late
+EARLY_PRESS = -1   # flip-locked response time of a keypress made before the first flip of its stream
+TIMING_FIELDS = ('frames', 'dropped', 'late', 'meanInterval', 'jitter', 'maxInterval')
+TIMING_DTYPE = np.dtype([('label', 'S8'), ('trial', 'i4'), ('frames', 'i4'), ('dropped', 'i4'), ('late', 'i4'),
+                         ('meanInterval', 'f8'), ('jitter', 'f8'), ('maxInterval', 'f8')])
+RESPONSE_DTYPE = np.dtype([('label', 'S8'), ('trial', 'i4'),
+                           ('rt', 'f8'),        # response time as written to the session file
+                           ('flipRT', 'f8')])   # response time from the first flip of the stream (99999 if none, EARLY_PRESS if before it)
+
+def timingPath(filename):
+    '''Returns the path of the timing file kept next to the given session file.'''
+    return filename + '.timing'
+
+def responsePath(filename):
+    '''Returns the path of the response time file kept next to the given session file.'''
+    return filename + '.rt'
+
+def flipLockedRT(pressTime, flipTimes):
+    '''
+    Returns the time of the given keypress from the first of the given flips (on the same clock), or
+    EARLY_PRESS if the keypress came before that flip.
+    '''
+    rt = pressTime - flipTimes[0]
+    return rt if rt >= 0 else EARLY_PRESS
+
+def flipSummary(flipTimes, refreshRate, lateMargin=LATE_MARGIN):
+    '''
+    Returns a dictionary of the number of flips of the given timestamps (in seconds), the number of
+    refreshes dropped between them, the number of intervals longer than 1 + lateMargin refreshes and
+    the mean, standard deviation (jitter) and maximum of the intervals (NaN with fewer than 2 flips).
+    '''
+    intervals = np.diff(np.asarray(flipTimes, dtype=float))
+    refreshes = intervals * refreshRate
+    summary = {'frames': len(flipTimes),
+               'dropped': int(np.maximum(np.round(refreshes) - 1, 0).sum()),
+               'late': int((refreshes > 1 + lateMargin).sum())}
+    if len(intervals) == 0:
+        summary.update(meanInterval=np.nan, jitter=np.nan, maxInterval=np.nan)
+    else:
+        summary.update(meanInterval=intervals.mean(), jitter=intervals.std(), maxInterval=intervals.max())
+    return summary
+
+class _TrialLog(object):
+    '''Writes one line per trial: a label, the number of the trial among those of its label and values.'''
+
+    def __init__(self, f):
+        self.f = f
+        self.trials = {}  # label -> number of trials of that label written so far
+
+    def _writeLine(self, label, values):
+        '''Writes a line of the given label, the number of the trial among those of that label and the given values.'''
+        trial = self.trials.get(label, 0)
+        self.trials[label] = trial + 1
+        self.f.write(label + ' ' + str(trial) + ' ' + ' '.join(str(value) for value in values) + '\n')
+
+    def close(self):
+        self.f.close()
+
+class TimingLog(_TrialLog):
+    '''Writes the flipSummary of every stream of flips of a session to a timing file.'''
+
+    def __init__(self, f, refreshRate):
+        _TrialLog.__init__(self, f)
+        self.refreshRate = refreshRate
+
+    def write(self, label, flipTimes):
+        '''Writes the summary of the given flip timestamps as the next trial of the given label and returns it.'''
+        summary = flipSummary(flipTimes, self.refreshRate)
+        self._writeLine(label, [summary[field] for field in TIMING_FIELDS])
+        return summary
+
+class ResponseLog(_TrialLog):
+    '''Writes the old and the flip-locked response time of every trial of a session to a response file.'''
+
+    def write(self, label, rt, flipRT):
+        '''Writes the given response times as the next trial of the given label.'''
+        self._writeLine(label, (rt, flipRT))
+
+def _readLines(path, dtype):
+    '''Returns the lines of the given log file as an array of the given dtype, skipping incomplete ones.'''
+    rows = []
+    with open(path) as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) == len(dtype):
+                rows.append((tokens[0], int(tokens[1])) + tuple(float(token) for token in tokens[2:]))
+    return np.array(rows, dtype=dtype)
+
+def readTiming(path):
+    '''Returns the lines of the given timing file as a TIMING_DTYPE array, skipping incomplete ones.'''
+    return _readLines(path, TIMING_DTYPE)
+
+def readResponses(path):
+    '''Returns the lines of the given response file as a RESPONSE_DTYPE array, skipping incomplete ones.'''
+    return _readLines(path, RESPONSE_DTYPE)
@@ -0,0 +1,44 @@
+'''
+Grating textures of the orientation task gabor of color_preference_ST.py.
+
+Textures are built with array math and kept in a bounded LRU keyed on tilt, spatial frequency and
+resolution, so the tilts of a session (the 0.5 degree steps of the calibration staircases and then
+the calibrated +-tiltMag) can be precomputed once and every trial just looks its texture up.
+Cached textures are read-only since they are shared between trials.
+'''
+from collections import OrderedDict
+import numpy as np
+
+TEXTURE_SIZE = 256   # pixels per side
+PERIODS = 4          # sine periods across the texture
+TEXTURE_CACHE_SIZE = 64  # textures kept in memory (512 KB each at 256 x 256)
+
+_textureCache = OrderedDict()  # (degrees, periods, size) -> texture, least recently used first
+
+def rotatedSineTexture(degrees, periods=PERIODS, size=TEXTURE_SIZE):
+    '''Returns numpy array of grating texture rotated from vertical by given amount of degrees.'''
+    slope = np.arctan(degrees * np.pi / 180)  # gabor is rotated by degree amount in layout
+    ys, xs = np.mgrid[0:size, 0:size] - size // 2
+    dist = (-slope * ys + xs) / np.sqrt(1 + slope ** 2)
+    return np.cos(dist * 2.0 * np.pi / size * periods)
+
+def cachedTexture(degrees, periods=PERIODS, size=TEXTURE_SIZE):
+    '''Returns the read-only rotatedSineTexture of the given tilt, building it only if it is not cached.'''
+    key = (float(degrees), periods, size)
+    texture = _textureCache.pop(key, None)
+    if texture is None:
+        texture = rotatedSineTexture(degrees, periods, size)
+        texture.flags.writeable = False
+    _textureCache[key] = texture
+    while len(_textureCache) > TEXTURE_CACHE_SIZE:
+        _textureCache.popitem(last=False)
+    return texture
+
+def precomputeTextures(tilts, periods=PERIODS, size=TEXTURE_SIZE):
+    '''Builds and caches the textures of all the given tilts ahead of the trials that use them.'''
+    for degrees in tilts:
+        cachedTexture(degrees, periods, size)
+
+def staircaseTilts(maxTilt, step=0.5):
+    '''Returns the clockwise and counterclockwise tilts a staircase of the given step can reach up to maxTilt.'''
+    return [sign * step * i for i in range(int(maxTilt / step) + 1) for sign in (1.0, -1.0)]
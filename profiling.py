@@ -0,0 +1,126 @@
+'''
+Opt-in profiling of the stages of an analysis run.
+
+A Profiler records, for every stage (such as parsing a session file, removing outliers, running
+the statistical tests or saving a figure) and every subject the stage ran for, the number of calls,
+the wall time, the bytes read by the process and its peak memory. Stages nest: the time of a stage
+includes the stages run inside it, which inherit its subject unless they name their own. A disabled
+Profiler records nothing and costs one attribute check per stage.
+'''
+import csv
+import json
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+FIELDS = ('stage', 'subject', 'calls', 'seconds', 'bytesRead', 'peakMemory', 'peakGrowth')
+
+def bytesRead():
+    '''Returns the bytes this process has read so far (rchar of /proc/self/io), or 0 where that is unavailable.'''
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return 0
+
+def peakMemory():
+    '''Returns the peak resident memory of this process so far in bytes, or 0 where that is unavailable.'''
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes except on macOS
+
+class Profiler(object):
+    '''Call counts, wall time, bytes read and peak memory per stage and subject.'''
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stats = OrderedDict()  # (stage, subject) -> [calls, seconds, bytesRead, peakMemory, peakGrowth]
+        self._subjects = []         # subjects of the stages currently running
+
+    def enable(self, enabled=True):
+        '''Turns recording on (or off) and returns self.'''
+        self.enabled = enabled
+        return self
+
+    def reset(self):
+        '''Forgets everything recorded so far.'''
+        self.stats.clear()
+
+    @contextmanager
+    def stage(self, name, subject=None):
+        '''Records the code run inside the with block as a call of the given stage for the given subject.'''
+        if not self.enabled:
+            yield
+            return
+        if subject is None and self._subjects:
+            subject = self._subjects[-1]
+        self._subjects.append(subject)
+        startBytes, startPeak = bytesRead(), peakMemory()
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            peak = peakMemory()
+            self._subjects.pop()
+            self._add(name, subject, [1, seconds, bytesRead() - startBytes, peak, peak - startPeak])
+
+    def profiled(self, name):
+        '''Returns a decorator that records every call of the decorated function as the given stage.'''
+        def decorate(func):
+            @wraps(func)
+            def profiledFunc(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return profiledFunc
+        return decorate
+
+    def _add(self, name, subject, values):
+        '''Adds the given calls, seconds, bytes read, peak memory and peak growth to a stage and subject.'''
+        stats = self.stats.setdefault((name, subject), [0, 0.0, 0, 0, 0])
+        for i in (0, 1, 2, 4):
+            stats[i] += values[i]
+        stats[3] = max(stats[3], values[3])
+
+    def records(self):
+        '''Returns the recorded statistics as a list of dictionaries with the keys of FIELDS.'''
+        return [dict(zip(FIELDS, key + tuple(values))) for key, values in self.stats.items()]
+
+    def merge(self, records):
+        '''Adds in records of another Profiler (such as one of a worker process) and returns self.'''
+        for record in records:
+            self._add(record['stage'], record['subject'], [record[field] for field in FIELDS[2:]])
+        return self
+
+    def totals(self):
+        '''Returns the records of every stage summed over its subjects (with subject None), in order of first use.'''
+        totals = Profiler()
+        for record in self.records():
+            totals.merge([dict(record, subject=None)])
+        return totals.records()
+
+    def writeReport(self, path):
+        '''
+        Writes the per-stage totals and the per-subject records to the given path, as CSV if it ends
+        in .csv (the totals being the rows without a subject) and as JSON otherwise.
+        '''
+        subjects = [record for record in self.records() if record['subject'] is not None]
+        if path.endswith('.csv'):
+            with open(path, 'wb') as f:
+                writer = csv.DictWriter(f, FIELDS)
+                writer.writeheader()
+                writer.writerows(self.totals() + subjects)
+        else:
+            with open(path, 'w') as f:
+                json.dump({'stages': self.totals(), 'subjects': subjects}, f, indent=1, sort_keys=True)
+        return path
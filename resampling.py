@@ -0,0 +1,114 @@
+'''
+Sign-flip permutation tests and bootstrap confidence intervals for per-subject effects.
+
+The resamples are drawn as whole matrices and reduced with matrix products, a chunk of rows at a
+time so that memory stays bounded however many resamples are asked for. Several effects measured
+on the same subjects are resampled together, with the same sign flips and bootstrap draws.
+'''
+import numpy as np
+
+RESAMPLES = 10000            # default number of permutations / bootstrap resamples
+CHUNK_ELEMENTS = 1 << 22     # upper bound on the elements of the resample matrices built at once
+
+def _chunkRows(width):
+    '''Returns the number of resamples to build at once for resample matrices of the given width.'''
+    return max(1, CHUNK_ELEMENTS // max(1, width))
+
+def _asRows(values):
+    '''
+    Returns the given effects (one row of subjects per effect, or a single row) as a 2-D array with
+    NaNs replaced by 0, along with the mask of the values that were not NaN.
+    '''
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    valid = ~np.isnan(values)
+    return np.where(valid, values, 0), valid
+
+def _signChunks(n, resamples, rng):
+    '''
+    Yields matrices of +1/-1 sign flips over n subjects, resamples rows in total. If there are no
+    more than resamples distinct flips, every one of them is yielded exactly once instead.
+    '''
+    if n < 63 and 2 ** n <= resamples:
+        bits = np.arange(n)
+        for start in range(0, 2 ** n, _chunkRows(n)):
+            codes = np.arange(start, min(start + _chunkRows(n), 2 ** n))
+            yield 1 - 2 * ((codes[:, None] >> bits) & 1).astype(float)
+        return
+    for start in range(0, resamples, _chunkRows(n)):
+        yield 1 - 2 * rng.randint(0, 2, (min(_chunkRows(n), resamples - start), n)).astype(float)
+
+def signFlipTest(values, resamples=RESAMPLES, seed=None):
+    '''
+    Returns the two-sided p-values of the sign-flip permutation test that the mean of each given
+    effect (a row of per-subject values, NaNs ignored) is zero. A single row gives a single p-value.
+    '''
+    values = _asRows(values)[0]
+    observed = np.abs(values.sum(axis=1)) * (1 - 1e-9)
+    rng = np.random.RandomState(seed)
+    exceed = np.zeros(len(values))
+    total = 0
+    for signs in _signChunks(values.shape[1], resamples, rng):
+        exceed += (np.abs(signs.dot(values.T)) >= observed).sum(axis=0)
+        total += len(signs)
+    pValues = exceed / total if total == 2 ** values.shape[1] else (exceed + 1) / (total + 1)
+    return pValues[0] if len(pValues) == 1 else pValues
+
+def bootstrapMeans(values, resamples=RESAMPLES, seed=None):
+    '''
+    Returns a resamples x effects array of the means of the given effects (rows of per-subject
+    values, NaNs ignored) over bootstrap resamples of the subjects.
+    '''
+    values, valid = _asRows(values)
+    n = values.shape[1]
+    rng = np.random.RandomState(seed)
+    means = np.empty((resamples, len(values)))
+    chunk = _chunkRows(n * len(values))
+    for start in range(0, resamples, chunk):
+        draws = rng.randint(0, n, (min(chunk, resamples - start), n))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[start:start + len(draws)] = (values[:, draws].sum(axis=2) / valid[:, draws].sum(axis=2)).T
+    return means
+
+def effectInference(effects, resamples=RESAMPLES, alpha=0.05, seed=None):
+    '''
+    Returns a dictionary mapping the name of each of the given effects (a dictionary of names to
+    per-subject values of the same subjects) to a dictionary of its mean, its sign-flip p-value and
+    the bounds ciLow and ciHigh of its bootstrap percentile confidence interval at level 1 - alpha.
+    '''
+    names = sorted(effects.keys())
+    values = np.array([effects[name] for name in names], dtype=float)
+    pValues = np.atleast_1d(signFlipTest(values, resamples, seed))
+    lows, highs = np.percentile(bootstrapMeans(values, resamples, seed), [50 * alpha, 100 - 50 * alpha], axis=0)
+    output = {}
+    for i, name in enumerate(names):
+        output[name] = {'mean': np.nanmean(values[i]), 'p': pValues[i], 'ciLow': lows[i], 'ciHigh': highs[i]}
+    return output
+
+def _rowCorrelations(xs, ys):
+    '''Returns the Pearson correlation of every pair of rows of the given equally shaped 2-D arrays.'''
+    xs = xs - xs.mean(axis=1)[:, None]
+    ys = ys - ys.mean(axis=1)[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (xs * ys).sum(axis=1) / np.sqrt((xs ** 2).sum(axis=1) * (ys ** 2).sum(axis=1))
+
+def correlationInference(xs, ys, resamples=RESAMPLES, alpha=0.05, seed=None):
+    '''
+    Returns a dictionary of the Pearson correlation r of the given paired values, its two-sided
+    permutation p-value and the bounds ciLow and ciHigh of its bootstrap percentile confidence
+    interval at level 1 - alpha (resamples that leave one of the variables constant are ignored).
+    '''
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    n = len(xs)
+    r = _rowCorrelations(xs[None], ys[None])[0]
+    rng = np.random.RandomState(seed)
+    exceed, rs = 0, []
+    chunk = _chunkRows(2 * n)
+    for start in range(0, resamples, chunk):
+        rows = min(chunk, resamples - start)
+        permuted = ys[rng.rand(rows, n).argsort(axis=1)]
+        exceed += (np.abs(_rowCorrelations(np.tile(xs, (rows, 1)), permuted)) >= abs(r) * (1 - 1e-9)).sum()
+        draws = rng.randint(0, n, (rows, n))
+        rs.append(_rowCorrelations(xs[draws], ys[draws]))
+    rs = np.concatenate(rs)
+    low, high = np.percentile(rs[~np.isnan(rs)], [50 * alpha, 100 - 50 * alpha])
+    return {'r': r, 'p': (exceed + 1.0) / (resamples + 1), 'ciLow': low, 'ciHigh': high}
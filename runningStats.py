@@ -0,0 +1,105 @@
+'''
+Mergeable running statistics of groups of values.
+
+A RunningStats holds, for each of a fixed number of groups, the count, mean, sum of squared
+deviations (M2), minimum and maximum of the values added so far, and optionally a histogram over
+fixed bin edges for approximate quantiles. Batches are added with Welford/Chan updates and two
+RunningStats over the same groups merge exactly, so per-subject workers can each summarize their
+own trials and the results can be combined in any order without keeping the raw values.
+'''
+import numpy as np
+
+class RunningStats(object):
+    '''Running count, mean, M2, min, max and optional histogram of each of size groups.'''
+
+    def __init__(self, size=1, edges=None):
+        '''
+        Creates empty statistics for the given number of groups. If bin edges are given, a
+        histogram over them (plus one bin below and one above) is kept for quantile estimates.
+        '''
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.edges = None if edges is None else np.asarray(edges, dtype=float)
+        self.histogram = None if edges is None else np.zeros((size, len(self.edges) + 1))
+
+    def _combine(self, count, mean, m2):
+        '''Merges in the count, mean and M2 of other values of each group.'''
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * count / total, 0)
+        self.count = total
+
+    def add(self, values, groups=None):
+        '''
+        Adds the given values, each to the group of the same position in groups (or all to the
+        first group if groups is None), and returns self.
+        '''
+        values = np.asarray(values, dtype=float).ravel()
+        groups = np.zeros(len(values), dtype=int) if groups is None else np.asarray(groups, dtype=int).ravel()
+        if len(values) == 0:
+            return self
+        size = len(self.count)
+        count = np.bincount(groups, minlength=size).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nan_to_num(np.bincount(groups, values, size) / count)
+        m2 = np.bincount(groups, (values - mean[groups]) ** 2, size)
+        self._combine(count, mean, m2)
+        np.minimum.at(self.min, groups, values)
+        np.maximum.at(self.max, groups, values)
+        if self.histogram is not None:
+            np.add.at(self.histogram, (groups, np.searchsorted(self.edges, values, side='right')), 1)
+        return self
+
+    def merge(self, other):
+        '''Adds in the statistics of another RunningStats over the same groups and returns self.'''
+        self._combine(other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        if self.histogram is not None:
+            self.histogram = self.histogram + other.histogram
+        return self
+
+    def variance(self, ddof=0):
+        '''Returns the variance of each group (NaN for groups with no more than ddof values).'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=0):
+        '''Returns the standard deviation of each group.'''
+        return np.sqrt(self.variance(ddof))
+
+    def sem(self):
+        '''Returns the standard error of the mean of each group, as the population std over sqrt(count).'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.std() / np.sqrt(self.count)
+
+    def quantile(self, q):
+        '''
+        Returns the approximate q quantile (0 to 1) of each group, interpolated linearly within the
+        histogram bin that holds it and bounded by the group's minimum and maximum.
+        '''
+        if self.histogram is None:
+            raise ValueError('Quantiles need the RunningStats to be created with bin edges')
+        cumulative = np.cumsum(self.histogram, axis=1)
+        target = q * self.count
+        bins = np.minimum((cumulative < target[:, None]).sum(axis=1), self.histogram.shape[1] - 1)
+        rows = np.arange(len(bins))
+        before = cumulative[rows, bins] - self.histogram[rows, bins]
+        bounds = np.concatenate(([-np.inf], self.edges, [np.inf]))
+        low = np.maximum(bounds[bins], self.min)
+        high = np.minimum(bounds[bins + 1], self.max)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip((target - before) / self.histogram[rows, bins], 0, 1)
+            return np.where(self.count > 0, low + (high - low) * fraction, np.nan)
+
+def mergeAll(stats):
+    '''Returns the merge of the given RunningStats over the same groups (the first is updated in place).'''
+    stats = list(stats)
+    for other in stats[1:]:
+        stats[0].merge(other)
+    return stats[0]
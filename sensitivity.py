@@ -0,0 +1,98 @@
+'''
+Sensitivity of the group statistics to excluding subjects.
+
+Every statistic is computed from per-subject sums (counts, sums, sums of squares and cross
+products), so the statistics of all the leave-k-out subsets come from one product of the subset
+mask matrix with those per-subject terms instead of rerunning the tests subset by subset.
+'''
+import itertools
+import numpy as np
+from scipy import stats
+
+def subsetMasks(nSubjects, maxExcluded):
+    '''
+    Returns a float matrix with one row per subset of the subjects that leaves out at most
+    maxExcluded of them (1 for included subjects), starting with the full set, along with the tuple
+    of excluded subject positions of every row.
+    '''
+    excluded = [combo for k in range(maxExcluded + 1) for combo in itertools.combinations(range(nSubjects), k)]
+    masks = np.ones((len(excluded), nSubjects))
+    for row, combo in enumerate(excluded):
+        masks[row, list(combo)] = 0
+    return masks, excluded
+
+def oneSampleTests(values, masks):
+    '''
+    Returns the t statistics and two-sided p-values of the one-sample t-tests against zero (the same
+    as stats.ttest_rel against zeros) of the given per-subject values over every subset in masks.
+    '''
+    values = np.asarray(values, dtype=float)
+    n = masks.sum(axis=1)
+    sums = masks.dot(values)
+    variances = (masks.dot(values ** 2) - sums ** 2 / n) / (n - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = sums / n / np.sqrt(variances / n)
+    return t, 2 * stats.t.sf(np.abs(t), n - 1)
+
+def oneWayAnovas(groups, masks):
+    '''
+    Returns the F statistics and p-values of the one-way ANOVAs (as stats.f_oneway(*groups)) of
+    the given groups x subjects values over every subset in masks.
+    '''
+    groups = np.asarray(groups, dtype=float)
+    k = len(groups)
+    n = masks.sum(axis=1)
+    sums = masks.dot(groups.T)                 # subsets x groups
+    squares = masks.dot((groups ** 2).T).sum(axis=1)
+    correction = sums.sum(axis=1) ** 2 / (k * n)
+    between = (sums ** 2).sum(axis=1) / n - correction
+    within = squares - correction - between
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f = (between / (k - 1)) / (within / (k * n - k))
+    return f, stats.f.sf(f, k - 1, k * n - k)
+
+def correlations(xs, ys, masks):
+    '''
+    Returns the Pearson correlations and their two-sided p-values (as stats.linregress) of the
+    given paired per-subject values over every subset in masks.
+    '''
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    n = masks.sum(axis=1)
+    sx, sy = masks.dot(xs), masks.dot(ys)
+    sxx = masks.dot(xs ** 2) - sx ** 2 / n
+    syy = masks.dot(ys ** 2) - sy ** 2 / n
+    sxy = masks.dot(xs * ys) - sx * sy / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.clip(sxy / np.sqrt(sxx * syy), -1, 1)
+        t = r * np.sqrt((n - 2) / (1 - r ** 2))
+    return r, 2 * stats.t.sf(np.abs(t), n - 2)
+
+def sensitivityTable(ids, tests, maxExcluded=1):
+    '''
+    Returns a structured array with one row per subset of the given subject ids that leaves out
+    at most maxExcluded of them, the first being the full set, holding the excluded ids (joined
+    by commas), the number of subjects kept and, for every test, its statistic, p-value and the
+    change of the statistic from the full set (columns name, name + 'P' and name + 'Delta').
+    tests maps each name to ('ttest', values), ('anova', groups) or ('corr', (xs, ys)), where the
+    per-subject values are in the order of ids.
+    '''
+    masks, excluded = subsetMasks(len(ids), maxExcluded)
+    names = sorted(tests.keys())
+    dtype = [('excluded', 'S%d' % max(1, 3 * maxExcluded * max(len(id) for id in ids))), ('n', 'i4')]
+    for name in names:
+        dtype += [(name, 'f8'), (name + 'P', 'f8'), (name + 'Delta', 'f8')]
+    table = np.zeros(len(masks), dtype=dtype)
+    table['excluded'] = [','.join(ids[i] for i in combo) for combo in excluded]
+    table['n'] = masks.sum(axis=1)
+    for name in names:
+        kind, data = tests[name]
+        if kind == 'ttest':
+            statistic, p = oneSampleTests(data, masks)
+        elif kind == 'anova':
+            statistic, p = oneWayAnovas(data, masks)
+        elif kind == 'corr':
+            statistic, p = correlations(data[0], data[1], masks)
+        else:
+            raise ValueError('Unknown test kind: ' + kind)
+        table[name], table[name + 'P'], table[name + 'Delta'] = statistic, p, statistic - statistic[0]
+    return table
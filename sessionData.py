@@ -0,0 +1,590 @@
+'''
+Reads the session files written by color_preference_ST.py into columnar numpy arrays.
+
+A session file is parsed once into a Session object whose trial sections are numpy
+structured arrays, so that every analysis can select and reduce trials without
+re-tokenizing the text. Parsed sessions are cached in binary form next to the text file
+(see cachePath) and in a bounded in-process LRU, both invalidated when the file changes.
+'''
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import time
+import warnings
+from collections import OrderedDict
+import numpy as np
+
+CACHE_VERSION = 2  # bump whenever the Session layout or the parsing rules change
+MEMORY_CACHE_SIZE = 64  # number of parsed sessions kept in memory
+_memoryCache = OrderedDict()  # absolute path -> ((size, mtime), Session), least recently used first
+
+# One row per trial of the first experiment (suppression times)
+EXP1_DTYPE = np.dtype([('color', 'i2'),      # index into Session.colors
+                       ('loc', 'f8'),        # horizontal stimulus location
+                       ('brkTime', 'f8'),    # breaking time in seconds (99999 if never broken)
+                       ('passed', '?')])     # location task passed
+
+# One row per orientation task trial (calibration staircases and second experiment)
+TRIAL2_DTYPE = np.dtype([('stair', 'i1'),       # calibration staircase (0 or 1), -1 for main trials
+                         ('popColor', 'i1'),    # 1 for the favorite color popping out, 2 for least favorite
+                         ('popLoc', 'f8'),      # vertical location of the popout cross
+                         ('gabLoc', 'f8'),      # vertical location of the gabor
+                         ('tilt', 'f8'),        # clockwise tilt of the gabor in degrees
+                         ('rt', 'f8'),          # response time in seconds
+                         ('passed', '?'),       # orientation task passed
+                         ('visibility', 'i1'),  # reported visibility of the prime (0, 1 or 2)
+                         ('seenUp', '?')])      # reported prime location was the top
+
+# Binary trial record format (see writeTrialRecords), one fixed-width little-endian record per line
+# of a session file. Fields that do not apply to a record's kind are NaN or -1.
+RECORD_MAGIC = 'CPVTRIAL'
+RECORD_VERSION = 1
+RECORD_SUFFIX = '.trials'
+EXP1_RECORD, CALIB_RECORD, EXP2_RECORD, REVERSAL_RECORD = 1, 2, 3, 4  # values of the kind field
+RECORD_DTYPE = np.dtype([('kind', 'u1'), ('stair', 'i1'), ('popColor', 'i1'), ('visibility', 'i1'),
+                         ('passed', '?'), ('seenUp', '?'), ('color', '<i2'), ('loc', '<f8'), ('brkTime', '<f8'),
+                         ('popLoc', '<f8'), ('gabLoc', '<f8'), ('tilt', '<f8'), ('rt', '<f8')])
+
+class Session(object):
+    '''
+    Parsed contents of a single session file.
+
+    colors holds the color strings in canonical rainbow order (as written on the preferences
+    line) and ranks the matching preference ranks (0 if unranked). exp1, calib and exp2 are
+    structured arrays of EXP1_DTYPE and TRIAL2_DTYPE, and calibReversals holds the number of
+    calibration trials completed when each staircase reversal was logged.
+    '''
+    def __init__(self, filename, colors, ranks, equiluminantColor, exp1, calib, calibReversals, exp2):
+        self.filename = filename
+        self.colors = colors
+        self.ranks = ranks
+        self.equiluminantColor = equiluminantColor
+        self.exp1 = exp1
+        self.calib = calib
+        self.calibReversals = calibReversals
+        self.exp2 = exp2
+
+    def rankedColors(self):
+        '''Returns the colors that were given a preference rank, in canonical rainbow order.'''
+        return [color for color, rank in zip(self.colors, self.ranks) if rank > 0]
+
+    def colorOfRank(self, rank):
+        '''Returns the color string given the preference rank (1 for most favorite).'''
+        return self.colors[list(self.ranks).index(rank)]
+
+def _trial2Row(tokens, stair):
+    '''Converts the tokens of a layout line from orientationTask into a TRIAL2_DTYPE row tuple.'''
+    return (stair, int(tokens[0][1:-1]), float(tokens[1][:-1]), float(tokens[2][:-1]), float(tokens[3][:-1]),
+            float(tokens[4]), tokens[5] == 'True', int(tokens[6]), tokens[7] == 'up')
+
+INDEX_VERSION = 1  # bump whenever the layout of the section index sidecar changes
+_SECTION_ENDS = {'START1': 'END1', 'CALIB': 'START2', 'START2': 'END2'}  # section marker -> marker ending it
+_INDEX_RE = re.compile(r'^(?:(START1|END1|CALIB|START2|END2|REV\d+)[ \t\r]*|(preferences|equiluminantColor): .*)$', re.M)
+_REVERSAL_RE = re.compile(r'^REV(\d+)[ \t\r]*$', re.M)
+
+def indexPath(filename):
+    '''Returns the path of the section index kept next to the given session file.'''
+    return filename + '.idx'
+
+def _fingerprint(data):
+    '''Returns a short hex digest of the given bytes.'''
+    return hashlib.sha1(data).hexdigest()[:16]
+
+def sectionIndex(filename):
+    '''
+    Returns the byte offsets of the marker lines of the given session file as a list of
+    (name, line start, line end) tuples in file order, where name is a section marker, a REVn line,
+    'preferences' or 'equiluminantColor', and line end is the offset just past the newline.
+    The index is kept in a JSON sidecar (see indexPath) and only the bytes appended since it was
+    last updated are scanned. It is rebuilt if the file shrank or if its first bytes or the last
+    indexed bytes changed, i.e. whenever it was not just appended to.
+    '''
+    try:
+        with open(indexPath(filename), 'r') as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        index = None
+    size = os.path.getsize(filename)
+    with open(filename, 'r') as f:
+        unchanged = False
+        if index is not None and index.get('version') == INDEX_VERSION and index['scanned'] <= size:
+            head = f.read(index['headSize'])
+            f.seek(index['scanned'] - index['tailSize'])
+            tail = f.read(index['tailSize'])
+            unchanged = _fingerprint(head) == index['head'] and _fingerprint(tail) == index['tail']
+        if not unchanged:
+            index = {'version': INDEX_VERSION, 'scanned': 0, 'entries': []}
+        f.seek(index['scanned'])
+        chunk = f.read()
+        f.seek(0)
+        head = f.read(64)
+    complete = chunk.rfind('\n') + 1  # a trailing partial line is indexed once it is complete
+    if complete > 0 or not unchanged:
+        for match in _INDEX_RE.finditer(chunk, 0, complete):
+            index['entries'].append([match.group(1) or match.group(2), index['scanned'] + match.start(),
+                                     index['scanned'] + match.end() + 1])
+        tail = (tail if unchanged else '')[-64:] + chunk[:complete]
+        index['scanned'] += complete
+        index.update(headSize=len(head), head=_fingerprint(head), tailSize=min(len(tail), 64),
+                     tail=_fingerprint(tail[-64:]))
+        try:
+            with open(indexPath(filename), 'w') as f:
+                json.dump(index, f)
+        except (IOError, OSError):
+            pass
+    return [(str(name), start, end) for name, start, end in index['entries']]
+
+def _sectionRanges(entries):
+    '''
+    Returns a dictionary mapping START1, CALIB and START2 to the byte range of their body in the given
+    index, and preferences and equiluminantColor to the range of their last line. A body runs from
+    the first occurrence of its marker to the first END1, START2 or END2 respectively after it (None
+    for the end of the file), so a section started again by a restart appended to the file continues
+    rather than ending at the repeated marker.
+    '''
+    ranges = {}
+    for i, (name, start, end) in enumerate(entries):
+        if name in ('preferences', 'equiluminantColor'):
+            ranges[name] = (start, end)
+        elif name in _SECTION_ENDS and name not in ranges:
+            following = [other[1] for other in entries[i + 1:] if other[0] == _SECTION_ENDS[name]]
+            ranges[name] = (end, following[0] if following else None)
+    return ranges
+
+def _readRange(f, byteRange):
+    '''Returns the text of the given (start, end) byte range of an open file, or '' if the range is None.'''
+    if byteRange is None:
+        return ''
+    f.seek(byteRange[0])
+    return f.read() if byteRange[1] is None else f.read(byteRange[1] - byteRange[0])
+
+def readSection(filename, marker):
+    '''
+    Returns the text of the body of the given section (START1, CALIB or START2) of the given session
+    file, seeking straight to it through the section index.
+    '''
+    with open(filename, 'r') as f:
+        return _readRange(f, _sectionRanges(sectionIndex(filename)).get(marker))
+
+def _numericRows(text, nColumns):
+    '''
+    Decodes the lines of the given text that consist of exactly nColumns space-separated numbers into
+    a 2-D float array with one row per line. The layout of every line is checked with whole-buffer
+    numpy passes and the numbers are converted in one pass; only a text containing other lines
+    falls back to filtering line by line.
+    '''
+    if not text:
+        return np.zeros((0, nColumns))
+    chars = np.frombuffer(text, dtype=np.uint8)
+    isNewline = chars == ord('\n')
+    lineOf = np.cumsum(isNewline) - isNewline
+    nLines = lineOf[-1] + 1
+    spaces = np.bincount(lineOf[chars == ord(' ')], minlength=nLines)
+    lengths = np.bincount(lineOf[~isNewline], minlength=nLines)
+    isRow = spaces == nColumns - 1
+    if np.all(isRow | (lengths == 0)):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # raised for text that is not all numbers, caught by the count below
+            values = np.fromstring(text, sep=' ')
+        if len(values) == nColumns * np.count_nonzero(isRow):
+            return values.reshape(-1, nColumns)
+    rows = []
+    for line in text.split('\n'):
+        tokens = line.strip().split(' ')
+        if len(tokens) == nColumns:
+            try:
+                rows.append([float(token) for token in tokens])
+            except ValueError:
+                pass
+    return np.array(rows, dtype=float).reshape(-1, nColumns)
+
+def _numericTrialText(text):
+    '''
+    Rewrites the text of a section of orientation task lines as plain numbers, dropping the brackets
+    and commas of the layout tuples and encoding True/up as 1 and False/down as 0.
+    '''
+    for old, new in (('(', ''), (')', ''), (',', ''), ('True', '1'), ('False', '0'), ('up', '1'), ('down', '0')):
+        text = text.replace(old, new)
+    return text
+
+def _trial2Columns(values, stair):
+    '''Converts a 2-D array of decoded orientation task lines into a TRIAL2_DTYPE array.'''
+    trials = np.zeros(len(values), dtype=TRIAL2_DTYPE)
+    trials['stair'] = stair
+    for i, name in enumerate(('popColor', 'popLoc', 'gabLoc', 'tilt', 'rt', 'passed', 'visibility', 'seenUp')):
+        trials[name] = values[:, i]
+    return trials
+
+def parseSession(filename):
+    '''
+    Reads the given session file and returns it as a Session. The sections are located through
+    the section index and each is read and decoded as one buffer with vectorized numpy operations
+    rather than line by line. A repeated section marker (a restart appended to the file) continues
+    its section, and lines that do not have the layout of their section are skipped.
+    '''
+    ranges = _sectionRanges(sectionIndex(filename))
+    with open(filename, 'r') as f:
+        sections = dict((name, _readRange(f, ranges.get(name))) for name in ('START1', 'CALIB', 'START2'))
+        prefs = _readRange(f, ranges.get('preferences')).strip().split(' ')[1:]
+        equiluminantColor = _readRange(f, ranges.get('equiluminantColor')).strip().split(' ')[1:]
+    prefs = [(pref[:-1], int(pref[-1])) for pref in prefs if pref]
+    equiluminantColor = equiluminantColor[0] if equiluminantColor else None
+
+    # color triplets become three numbers, e.g. (27,0,0) -0.0625 3.2 True -> 27 0 0 -0.0625 3.2 1
+    exp1Text = sections.get('START1', '')
+    for old, new in (('(', ''), (')', ''), (',', ' '), ('True', '1'), ('False', '0')):
+        exp1Text = exp1Text.replace(old, new)
+    values = _numericRows(exp1Text, 6)
+    exp1 = np.zeros(len(values), dtype=EXP1_DTYPE)
+    exp1['loc'] = values[:, 3]
+    exp1['brkTime'] = values[:, 4]
+    exp1['passed'] = values[:, 5]
+    colors = [color for color, rank in prefs]
+    ranks = [rank for color, rank in prefs]
+    triplets = values[:, :3].astype(int)
+    exp1Colors, firstSeen, inverse = np.unique(np.dot(triplets, [1 << 32, 1 << 16, 1]), return_index=True,
+                                               return_inverse=True)
+    codes = np.zeros(len(exp1Colors), dtype=int)
+    for i in np.argsort(firstSeen):
+        color = '(%d,%d,%d)' % tuple(triplets[firstSeen[i]])
+        if color not in colors:
+            colors.append(color)
+            ranks.append(0)
+        codes[i] = colors.index(color)
+    exp1['color'] = codes[inverse]
+
+    # each REVn line is padded to the layout of a calibration trial with a staircase of -1
+    values = _numericRows(_REVERSAL_RE.sub(r'-1 0 0 0 0 0 0 0 \1', _numericTrialText(sections.get('CALIB', ''))), 9)
+    isReversal = values[:, 0] == -1
+    calibReversals = np.cumsum(~isReversal)[isReversal]
+    calib = _trial2Columns(values[~isReversal, 1:], values[~isReversal, 0])
+    exp2 = _trial2Columns(_numericRows(_numericTrialText(sections.get('START2', '')), 8), -1)
+    return Session(filename, colors, np.array(ranks, dtype=int), equiluminantColor, exp1, calib, calibReversals, exp2)
+
+def recordPath(filename):
+    '''Returns the path of the binary trial record file converted from the given text session file.'''
+    return os.path.splitext(filename)[0] + RECORD_SUFFIX
+
+def writeTrialRecords(session, path):
+    '''
+    Writes the given Session to path in the binary trial record format: the 8-byte RECORD_MAGIC,
+    the format version and header length as little-endian uint32s, a JSON header (colors, ranks and
+    equiluminant color) padded to a multiple of 8 bytes, then one RECORD_DTYPE record per trial or
+    staircase reversal in the order they were logged.
+    '''
+    header = json.dumps({'colors': session.colors, 'ranks': session.ranks.tolist(),
+                         'equiluminantColor': session.equiluminantColor,
+                         'source': os.path.basename(session.filename)})
+    header += ' ' * (-len(header) % 8)
+    nCalib = len(session.calib) + len(session.calibReversals)
+    records = np.zeros(len(session.exp1) + nCalib + len(session.exp2), dtype=RECORD_DTYPE)
+    for name in ('loc', 'brkTime', 'popLoc', 'gabLoc', 'tilt', 'rt'):
+        records[name] = np.nan
+    records['stair'] = records['popColor'] = records['visibility'] = records['color'] = -1
+    exp1 = records[:len(session.exp1)]
+    exp1['kind'] = EXP1_RECORD
+    for name in EXP1_DTYPE.names:
+        exp1[name] = session.exp1[name]
+    # reversal records go right after the number of calibration trials logged before them
+    calib = records[len(session.exp1):len(session.exp1) + nCalib]
+    isReversal = np.zeros(nCalib, dtype=bool)
+    isReversal[session.calibReversals + np.arange(len(session.calibReversals))] = True
+    calib['kind'] = np.where(isReversal, REVERSAL_RECORD, CALIB_RECORD)
+    exp2 = records[len(session.exp1) + nCalib:]
+    exp2['kind'] = EXP2_RECORD
+    for name in TRIAL2_DTYPE.names:
+        calib[name][~isReversal] = session.calib[name]
+        exp2[name] = session.exp2[name]
+    with open(path + '.tmp', 'wb') as f:
+        f.write(RECORD_MAGIC + struct.pack('<II', RECORD_VERSION, len(header)) + header)
+        records.tofile(f)
+    os.rename(path + '.tmp', path)
+
+def _kindRows(records, kind):
+    '''Returns the records of the given kind, as a view of records if they are contiguous.'''
+    rows = np.flatnonzero(records['kind'] == kind)
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return records[rows[0]:rows[-1] + 1]
+    return records[rows]
+
+def readTrialRecords(path):
+    '''
+    Returns the Session stored in the given binary trial record file. The records are memory-mapped
+    rather than read, and the trial arrays of the Session are views of the mapping wherever the
+    trials of a section are contiguous.
+    '''
+    with open(path, 'rb') as f:
+        magic = f.read(len(RECORD_MAGIC))
+        if magic != RECORD_MAGIC:
+            raise ValueError(path + ' is not a trial record file')
+        version, headerSize = struct.unpack('<II', f.read(8))
+        if version > RECORD_VERSION:
+            raise ValueError(path + ' uses trial record format version ' + str(version) + ', which is newer than this reader')
+        header = json.loads(f.read(headerSize))
+    offset = len(RECORD_MAGIC) + 8 + headerSize
+    if os.path.getsize(path) > offset:
+        records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=offset)
+    else:
+        records = np.zeros(0, dtype=RECORD_DTYPE)
+    calibRecords = records[(records['kind'] == CALIB_RECORD) | (records['kind'] == REVERSAL_RECORD)]
+    isReversal = calibRecords['kind'] == REVERSAL_RECORD
+    return Session(path, [str(color) for color in header['colors']], np.array(header['ranks'], dtype=int),
+                   header['equiluminantColor'] and str(header['equiluminantColor']), _kindRows(records, EXP1_RECORD),
+                   calibRecords[~isReversal], np.cumsum(~isReversal)[isReversal], _kindRows(records, EXP2_RECORD))
+
+def convertSession(filename, path=None):
+    '''
+    Converts the given text session file into the binary trial record format, at path or by default
+    next to it (see recordPath), and returns the path written.
+    '''
+    path = path or recordPath(filename)
+    writeTrialRecords(parseSession(filename), path)
+    return path
+
+def cachePath(filename):
+    '''Returns the path of the binary cache kept next to the given session file.'''
+    return filename + '.npz'
+
+def _fileHash(filename):
+    '''Returns the SHA-1 hex digest of the contents of the given file.'''
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _writeSessionCache(session, stat):
+    '''
+    Saves the given parsed session next to its text file, keyed on the size, modification time
+    and content hash of that file. Failing to write the cache (e.g. read-only data) is not an error.
+    '''
+    path = cachePath(session.filename)
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, version=CACHE_VERSION, size=stat.st_size, mtime=stat.st_mtime,
+                     hash=_fileHash(session.filename), colors=np.array(session.colors), ranks=session.ranks,
+                     equiluminantColor=np.array(session.equiluminantColor or ''), exp1=session.exp1,
+                     calib=session.calib, calibReversals=session.calibReversals, exp2=session.exp2)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+
+def _readSessionCache(filename, stat):
+    '''
+    Returns the Session saved in the binary cache of the given session file, or None if there is
+    no cache or the file has changed since it was written. A file whose modification time changed
+    but whose size and content hash did not is still served from the cache.
+    '''
+    try:
+        with np.load(cachePath(filename)) as data:
+            if int(data['version']) != CACHE_VERSION or int(data['size']) != stat.st_size:
+                return None
+            if float(data['mtime']) != stat.st_mtime and str(data['hash']) != _fileHash(filename):
+                return None
+            return Session(filename, [str(color) for color in data['colors'].tolist()], data['ranks'],
+                           str(data['equiluminantColor']) or None, data['exp1'], data['calib'],
+                           data['calibReversals'], data['exp2'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+def clearSessionCache():
+    '''Empties the in-process cache of parsed sessions (the binary caches on disk are kept).'''
+    _memoryCache.clear()
+
+def loadSession(source, useCache=True):
+    '''
+    Returns the Session for the given session filename, or the source itself if it is already a
+    Session. Binary trial record files are memory-mapped directly. Otherwise, unless useCache is
+    False, sessions are served from the in-process cache or the binary cache next to the file when
+    the file is unchanged, so the returned arrays should be treated as read-only.
+    '''
+    if isinstance(source, Session):
+        return source
+    if source.endswith(RECORD_SUFFIX):
+        return readTrialRecords(source)
+    if not useCache:
+        return parseSession(source)
+    stat = os.stat(source)
+    key = os.path.abspath(source)
+    if key in _memoryCache:
+        fileState, session = _memoryCache.pop(key)
+        if fileState == (stat.st_size, stat.st_mtime):
+            _memoryCache[key] = (fileState, session)
+            return session
+    session = _readSessionCache(source, stat)
+    if session is None:
+        session = parseSession(source)
+        _writeSessionCache(session, stat)
+    _rememberSession(key, stat, session)
+    return session
+
+def _rememberSession(key, stat, session):
+    '''Puts the given session into the in-process cache, evicting the least recently used ones.'''
+    _memoryCache[key] = ((stat.st_size, stat.st_mtime), session)
+    while len(_memoryCache) > MEMORY_CACHE_SIZE:
+        _memoryCache.popitem(last=False)
+
+def _starCall(funcAndArgs):
+    '''Calls the given function with the given tuple of arguments (a picklable helper for parallelMap).'''
+    func, args = funcAndArgs
+    return func(*args)
+
+def parallelMap(func, argTuples, workers):
+    '''
+    Returns [func(*args) for args in argTuples] computed over a pool of the given number of worker
+    processes (None for one per core). func must be a module-level function so it can be sent to the
+    workers, and the results are in the order of argTuples. With one worker nothing is forked.
+    '''
+    argTuples = list(argTuples)
+    if workers == 1 or len(argTuples) < 2:
+        return [func(*args) for args in argTuples]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(_starCall, [(func, args) for args in argTuples])
+    finally:
+        pool.close()
+        pool.join()
+
+def loadSessions(sources, workers=1):
+    '''
+    Returns the Sessions of the given session files (or Sessions) in order, parsing them over the
+    given number of worker processes. The parsed sessions are added to the in-process cache.
+    '''
+    sessions = parallelMap(loadSession, [(source,) for source in sources], workers)
+    if workers != 1:
+        for source, session in zip(sources, sessions):
+            if not isinstance(source, Session):
+                _rememberSession(os.path.abspath(source), os.stat(source), session)
+    return sessions
+
+class SessionFollower(object):
+    '''
+    Follows a session file while color_preference_ST.py is still appending to it, reading only the
+    bytes written since the last poll. Keeps running aggregates of the screened breaking times per
+    color (as in breaksToDict with includeAll), the state of both calibration staircases and the
+    orientation task accuracy and response time per cue condition (invisible main trials only).
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.reset()
+
+    def reset(self):
+        '''Forgets everything read so far, so the next poll starts from the beginning of the file.'''
+        self.offset = 0
+        self.sections = set()  # sections being read, from the first occurrence of their marker to their end
+        self.finished = False
+        self._partial = ''
+        self._ended = set()
+        self._lastStair = None
+        self.breakStats = {}  # color -> [trials kept, sum, sum of squares] of breaking times
+        self.exp1Trials = 0
+        self.stairs = {0: {'trials': 0, 'tilt': None, 'revTilts': []}, 1: {'trials': 0, 'tilt': None, 'revTilts': []}}
+        self.cueStats = {}  # cue condition -> [trials, corrects, sum of response times]
+        self.exp2Trials = 0
+
+    def poll(self):
+        '''
+        Reads the bytes appended since the last poll and updates the aggregates with every complete
+        line. A trailing partial line is kept until its end is written. Returns the number of lines read.
+        '''
+        size = os.path.getsize(self.filename)
+        if size < self.offset:  # the file was replaced or truncated
+            self.reset()
+        if size == self.offset:
+            return 0
+        with open(self.filename, 'r') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._readLine(line)
+        return len(lines)
+
+    def _readLine(self, line):
+        '''Updates the aggregates with a single complete line of the session file.'''
+        tokens = line.strip().split(' ')
+        marker = tokens[0]
+        if marker in ('START1', 'END1', 'CALIB', 'START2', 'END2') and len(tokens) == 1:
+            for section, end in _SECTION_ENDS.items():
+                if marker == end:
+                    self.sections.discard(section)
+                    self._ended.add(section)
+            if marker in _SECTION_ENDS and marker not in self._ended:
+                self.sections.add(marker)  # a repeated marker continues its section
+            self.finished = self.finished or marker == 'END2'
+        elif 'START1' in self.sections and len(tokens) == 4:
+            self.exp1Trials += 1
+            brkTime = min(float(tokens[2]), 10.23)
+            if brkTime > 0.3 and tokens[3] == 'True':
+                stats = self.breakStats.setdefault(marker, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += brkTime
+                stats[2] += brkTime ** 2
+        elif 'CALIB' in self.sections:
+            if marker.startswith('REV') and self._lastStair is not None:
+                # the staircase moved its tilt by 0.5 degrees right before logging the reversal
+                stair = self.stairs[self._lastStair[0]]
+                stair['revTilts'].append(stair['tilt'] + (-0.5 if self._lastStair[1] else 0.5))
+            elif len(tokens) == 9:
+                trial = _trial2Row(tokens[1:], int(marker))
+                stair = self.stairs[trial[0]]
+                stair['trials'] += 1
+                stair['tilt'] = abs(trial[4])
+                self._lastStair = (trial[0], trial[6])
+        elif 'START2' in self.sections and len(tokens) == 8:
+            self.exp2Trials += 1
+            trial = _trial2Row(tokens, -1)
+            if trial[7] == 0:
+                cond = ('fav' if trial[1] == 1 else 'leastFav') + ('Same' if trial[2] == trial[3] else 'Opp')
+                stats = self.cueStats.setdefault(cond, [0, 0, 0.0])
+                stats[0] += 1
+                stats[1] += trial[6]
+                stats[2] += trial[5]
+
+    def breakMeans(self):
+        '''Returns a dictionary of the mean and standard deviation of the screened breaking times per color.'''
+        means = {}
+        for color, (count, total, squares) in self.breakStats.items():
+            mean = total / count
+            means[color] = (mean, np.sqrt(max(squares / count - mean ** 2, 0.0)))
+        return means
+
+    def cueAccuracies(self):
+        '''Returns a dictionary of the orientation task accuracy per cue condition, as in oriTaskAcc.'''
+        return dict((cond, float(corrects) / count) for cond, (count, corrects, rts) in self.cueStats.items())
+
+    def cueSpeeds(self):
+        '''Returns a dictionary of the mean response time per cue condition, as in oriTaskSpd.'''
+        return dict((cond, rts / count) for cond, (count, corrects, rts) in self.cueStats.items())
+
+    def summary(self):
+        '''Returns a short human-readable report of the aggregates so far.'''
+        lines = ['%s: %d first experiment trials, %d main trials' % (self.filename, self.exp1Trials, self.exp2Trials)]
+        for color, (mean, sd) in sorted(self.breakMeans().items()):
+            lines.append('  %s: %.2f +- %.2f s (%d kept)' % (color, mean, sd, self.breakStats[color][0]))
+        for n in (0, 1):
+            stair = self.stairs[n]
+            lines.append('  staircase %d: %d trials, tilt %s, %d reversals' % (n, stair['trials'], stair['tilt'],
+                                                                            len(stair['revTilts'])))
+        for cond, acc in sorted(self.cueAccuracies().items()):
+            lines.append('  %s: %.2f correct, %.2f s (%d trials)' % (cond, acc, self.cueSpeeds()[cond],
+                                                                   self.cueStats[cond][0]))
+        return '\n'.join(lines)
+
+    def follow(self, interval=2.0, callback=None):
+        '''
+        Polls the file every interval seconds until the second experiment has ended, calling
+        callback with this follower whenever new lines were read.
+        '''
+        while not self.finished:
+            if self.poll() and callback is not None:
+                callback(self)
+            if not self.finished:
+                time.sleep(interval)
+
+if __name__ == '__main__':
+    for filename in sys.argv[1:]:
+        print 'Wrote ' + convertSession(filename)
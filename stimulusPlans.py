@@ -0,0 +1,74 @@
+'''
+Frame plans of the render loops of color_preference_ST.py.
+
+A frame plan is a FRAME_DTYPE array with one row per frame of a trial giving the Mondrian to show,
+the opacity of the stimulus and whether the Mondrians and the stimulus are drawn, so the render
+loop only reads rows instead of working out the flicker and ramp schedules on every frame. Plans
+depend only on the refresh rate and the trial type, are built once and shared (read-only), and
+need no window, so they can be checked offline.
+'''
+import numpy as np
+
+MONDRIANS = 10  # Mondrian images cycled through, 10 times per second
+
+FRAME_DTYPE = np.dtype([('mondrian', 'i4'),     # index of the Mondrian shown in this frame
+                        ('opacity', 'f8'),      # opacity of the stimulus
+                        ('mondrians', '?'),     # whether the Mondrians are drawn
+                        ('stim', '?')])         # whether the stimulus is drawn
+
+_planCache = {}  # (plan kind, refresh rate, options) -> plan
+
+def _cachedPlan(key, build):
+    '''Returns the plan of the given key, building it with build() and making it read-only the first time.'''
+    plan = _planCache.get(key)
+    if plan is None:
+        plan = build()
+        plan.flags.writeable = False
+        _planCache[key] = plan
+    return plan
+
+def mondrianIndices(nFrames, refreshRate):
+    '''Returns the index of the Mondrian of each frame, advancing (and wrapping) 10 times per second from frame 0.'''
+    changes = np.arange(nFrames) % (refreshRate / 10.0) < 1
+    return np.cumsum(changes) % MONDRIANS
+
+def breakingTimePlan(refreshRate, blinking):
+    '''
+    Returns the frame plan of a circleBreakingTime trial: 10.8 seconds over which the stimulus fades
+    in during the first 3 seconds, with Mondrians until 10 seconds. If blinking, both flicker on a
+    0.6 second cycle, the Mondrians being shown for the first third of a second plus 4 frames of
+    every cycle and the stimulus from its 3rd frame to 2 frames before the Mondrians go.
+    '''
+    def build():
+        frames = np.arange(int(10.8 * refreshRate))
+        rampFrames = 3.0 * refreshRate
+        plan = np.zeros(len(frames), dtype=FRAME_DTYPE)
+        plan['mondrian'] = mondrianIndices(len(frames), refreshRate)
+        plan['opacity'] = np.minimum(frames, np.floor(rampFrames)) / rampFrames
+        plan['mondrians'] = frames < 10 * refreshRate
+        plan['stim'] = True
+        if blinking:
+            cycle = frames % int(refreshRate * 0.6)
+            plan['mondrians'] &= cycle < refreshRate / 3.0 + 4
+            plan['stim'] = (cycle >= 2) & (cycle < refreshRate / 3.0 + 2)
+        return plan
+    return _cachedPlan(('breakingTime', refreshRate, bool(blinking)), build)
+
+def primePlan(refreshRate):
+    '''
+    Returns the frame plan of a ringPrime presentation: 2.3 seconds of Mondrians flickering on a 0.5
+    second cycle, shown for the first refreshRate / 5 + 6 frames of every cycle (an integer division
+    for an integer rate, as in the original loop), with the prime fading in from the 3rd frame of the
+    cycle until 3 frames before the Mondrians go. The opacity only applies to the frames in which the
+    prime is drawn.
+    '''
+    def build():
+        frames = np.arange(int(2.3 * refreshRate))
+        cycle = frames % int(refreshRate * 0.5)
+        plan = np.zeros(len(frames), dtype=FRAME_DTYPE)
+        plan['mondrian'] = mondrianIndices(len(frames), refreshRate)
+        plan['mondrians'] = cycle < refreshRate / 5 + 6
+        plan['stim'] = (cycle >= 3) & (cycle < refreshRate / 5 + 3)
+        plan['opacity'] = np.where(plan['stim'], (cycle - 2) / (refreshRate / 5.0 + .01), 0)
+        return plan
+    return _cachedPlan(('prime', refreshRate), build)
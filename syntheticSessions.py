@@ -0,0 +1,147 @@
+'''
+Writes synthetic session files in the format of color_preference_ST.py, for benchmarks and for
+trying out the analyses without real data.
+
+Each simulated subject runs the same procedure as the experiment: the shuffled color x side
+trials of the first experiment, the preference ranking, the equiluminant color, the two
+interleaved tilt staircases of the calibration (with their REV lines) and the shuffled layouts of
+the second experiment. Breaking times get slower for less preferred colors and orientation task
+accuracy follows a psychometric function of the tilt, with a small cueing effect of the favorite
+color, so the analyses have effects to find.
+
+Usage: python syntheticSessions.py outDir nSubjects [seed]
+'''
+import math
+import os
+import random
+import sys
+from sessionData import parallelMap
+
+COLORS = [(27, 0, 0), (12, 6, 0), (8, 8, 0), (0, 10, 0), (0, 0, 90), (24, 0, 24)]  # colorsToTest of the experiment
+STIM_LOCS = [-0.0625, 0.0625]
+RING_RADIUS = 0.1
+FIRST_STAGE_REPETITIONS = 15  # per color + side combination
+SECOND_STAGE_REPETITIONS = 10  # per layout
+STAIRCASE_REVERSALS = 12
+
+def _colorString(color):
+    '''Returns the given color triplet as written by the experiment.'''
+    return str(color).replace(' ', '')
+
+def _passedTask(rng, tilt, threshold, bonus=0.0):
+    '''Returns whether a simulated orientation judgement of the given tilt is correct.'''
+    accuracy = 0.5 + 0.5 * (1 - math.exp(-(abs(tilt) / threshold) ** 2)) + bonus
+    return rng.random() < accuracy
+
+def _orientationTrial(rng, layout, threshold, favCue):
+    '''Returns the output line of one orientation task trial of the given layout and whether it was passed.'''
+    cued = layout[1] == layout[2]
+    bonus = favCue if layout[0] == 1 and cued else -favCue if layout[0] == 1 else 0.0
+    passedTask = _passedTask(rng, layout[3], threshold, bonus)
+    responseTime = rng.lognormvariate(0.9, 0.25) - (0.1 if cued else 0.0)
+    visibility = rng.choice([0, 0, 0, 0, 0, 0, 1, 1, 2])
+    seen = ('down' if layout[1] < 0 else 'up') if visibility and rng.random() < 0.8 else rng.choice(['up', 'down'])
+    return (str(layout) + ' ' + str(responseTime) + ' ' + str(passedTask) + ' ' + str(visibility) +
+            ' ' + seen + '\n'), passedTask
+
+def sessionLines(seed=None, firstStageRepetitions=FIRST_STAGE_REPETITIONS,
+                 secondStageRepetitions=SECOND_STAGE_REPETITIONS, staircaseReversals=STAIRCASE_REVERSALS):
+    '''Returns the lines of the session file of one simulated subject with the given random seed.'''
+    rng = random.Random(seed)
+    ranks = list(range(1, len(COLORS) + 1))
+    rng.shuffle(ranks)
+    rankOf = dict(zip(COLORS, ranks))
+    baseline = rng.gauss(0.8, 0.4)     # log of the typical breaking time in seconds
+    prefSlope = rng.gauss(0.04, 0.03)  # increase of the log breaking time per rank
+    threshold = rng.uniform(1.0, 3.0)  # tilt (degrees) at which the task is about 82% correct
+    favCue = rng.gauss(0.03, 0.03)     # accuracy gained when the favorite color cues the gabor
+    lines = ['START1\n']
+    trials = [(color, stimLoc) for color in COLORS for stimLoc in STIM_LOCS] * firstStageRepetitions
+    rng.shuffle(trials)
+    for color, stimLoc in trials:
+        if rng.random() < 0.02:
+            breakingTime = rng.uniform(0.05, 0.3)
+        else:
+            breakingTime = rng.lognormvariate(baseline + prefSlope * (rankOf[color] - 3.5), 0.5)
+        if breakingTime >= 10.8:
+            breakingTime = 99999
+        passedTask = rng.random() < (0.5 if breakingTime == 99999 else 0.95)
+        lines.append(_colorString(color) + ' ' + str(stimLoc) + ' ' + str(breakingTime) + ' ' + str(passedTask) + '\n')
+    lines.append('END1\n')
+    lines.append('preferences: ' + ''.join(_colorString(color) + str(rankOf[color]) + ' ' for color in COLORS) + '\n')
+    leastFav = [color for color in COLORS if rankOf[color] == len(COLORS)][0]
+    scale = rng.choice([0.25 + 0.05 * step for step in range(11)]) / 0.5
+    lines.append('equiluminantColor: ' + _colorString(tuple(int(round(c * scale)) for c in leastFav)) + '\n')
+
+    lines.append('CALIB\n')
+    stairs = [{'tilt': 6.0, 'lowering': True, 'left': staircaseReversals, 'streak': 0, 'revTilts': []},
+              {'tilt': 1.0, 'lowering': False, 'left': staircaseReversals, 'streak': 0, 'revTilts': []}]
+    while stairs[0]['left'] > 0 or stairs[1]['left'] > 0:
+        n = 1 if stairs[0]['left'] == 0 else 0 if stairs[1]['left'] == 0 else rng.randint(0, 1)
+        stair = stairs[n]
+        layout = (rng.randint(1, 2), rng.choice([-RING_RADIUS, RING_RADIUS]), rng.choice([-RING_RADIUS, RING_RADIUS]),
+                  stair['tilt'] * rng.choice([-1.0, 1.0]))
+        line, passedTask = _orientationTrial(rng, layout, threshold, favCue)
+        lines.append(str(n) + ' ' + line)
+        reversal = False
+        if passedTask:
+            stair['streak'] += 1
+            if stair['streak'] == 3:
+                stair['streak'] = 0
+                if abs(stair['tilt']) > 0.1:
+                    stair['tilt'] -= 0.5
+                    if not stair['lowering']:
+                        stair['lowering'] = reversal = True
+        else:
+            stair['streak'] = 0
+            stair['tilt'] += 0.5
+            if stair['lowering']:
+                stair['lowering'] = False
+                reversal = True
+        if reversal:
+            stair['left'] -= 1
+            stair['revTilts'].append(stair['tilt'])
+            stair['streak'] = 0
+            lines.append('REV' + str(staircaseReversals - 1 - stair['left']) + '\n')
+    half = staircaseReversals // 2
+    tiltMag = sum(sum(stair['revTilts'][half:]) / len(stair['revTilts'][half:]) for stair in stairs) / 2.0
+
+    lines.append('START2\n')
+    layouts = [(popColor, popLoc, gabLoc, gabTilt) for popColor in [1, 2] for popLoc in [-RING_RADIUS, RING_RADIUS]
+               for gabLoc in [-RING_RADIUS, RING_RADIUS] for gabTilt in [-tiltMag, tiltMag]] * secondStageRepetitions
+    rng.shuffle(layouts)
+    for layout in layouts:
+        lines.append(_orientationTrial(rng, layout, threshold, favCue)[0])
+    lines.append('END2\n')
+    return lines
+
+def writeSession(filename, seed=None, **counts):
+    '''Writes the session file of one simulated subject; counts are the trial counts of sessionLines.'''
+    with open(filename, 'w') as f:
+        f.writelines(sessionLines(seed, **counts))
+    return filename
+
+def cohortIds(nSubjects):
+    '''Returns the ids of a cohort of the given size, zero padded to the same length (at least 2).'''
+    width = max(2, len(str(nSubjects)))
+    return ['%0*d' % (width, i + 1) for i in range(nSubjects)]
+
+def _writeSubject(outDir, id, seed, counts):
+    '''Writes the session file of the subject with the given id for writeCohort.'''
+    return writeSession(os.path.join(outDir, 'expData' + id + '.txt'), '%s-%s' % (seed, id), **counts)
+
+def writeCohort(outDir, nSubjects, seed=0, workers=1, **counts):
+    '''
+    Writes the session files expDataNN.txt of the given number of simulated subjects to the given
+    directory over the given number of processes and returns their ids. The subject with id NN
+    always gets the same session for the same seed and counts.
+    '''
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    ids = cohortIds(nSubjects)
+    parallelMap(_writeSubject, [(outDir, id, seed, counts) for id in ids], workers)
+    return ids
+
+if __name__ == '__main__':
+    ids = writeCohort(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0, None)
+    print 'Wrote ' + str(len(ids)) + ' session files to ' + sys.argv[1]
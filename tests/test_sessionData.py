@@ -0,0 +1,86 @@
+'''Tests of the session file parser on session files appended to by a restart.'''
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import sessionData
+import syntheticSessions
+
+class AppendedRestartTest(unittest.TestCase):
+    '''A session that crashed and was run again from the start, appending to the same file.'''
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'expData01.txt')
+        sessionData.clearSessionCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeRestart(self, marker, lines):
+        '''Writes a first run cut off the given number of lines after the given marker, then a full run.'''
+        first = syntheticSessions.sessionLines(1)
+        second = syntheticSessions.sessionLines(2)
+        with open(self.filename, 'w') as f:
+            f.writelines(first[:first.index(marker) + 1 + lines] + second)
+        return first[:first.index(marker) + 1 + lines], second
+
+    def assertSessionCounts(self, exp1, calib, exp2):
+        '''Checks the trials read by the parser and by a follower against the given counts.'''
+        session = sessionData.parseSession(self.filename)
+        self.assertEqual(len(session.exp1), exp1)
+        self.assertEqual([int((session.calib['stair'] == n).sum()) for n in (0, 1)], calib)
+        self.assertEqual(len(session.exp2), exp2)
+        follower = sessionData.SessionFollower(self.filename)
+        follower.poll()
+        self.assertEqual(follower.exp1Trials, exp1)
+        self.assertEqual([follower.stairs[n]['trials'] for n in (0, 1)], calib)
+        self.assertEqual(follower.exp2Trials, exp2)
+        self.assertTrue(follower.finished)
+
+    def testRestartDuringFirstExperiment(self):
+        first, second = self.writeRestart('START1\n', 47)
+        exp1 = 47 + second.index('END1\n') - 1
+        self.assertSessionCounts(exp1, [self.stairTrials(second, n) for n in (0, 1)], len(self.exp2Lines(second)))
+
+    def testRestartDuringCalibration(self):
+        first, second = self.writeRestart('CALIB\n', 30)
+        # the first experiment ends at the first END1 and the calibration continues to the first START2
+        calib = [self.stairTrials(first, n) + self.stairTrials(second, n) for n in (0, 1)]
+        self.assertSessionCounts(first.index('END1\n') - 1, calib, len(self.exp2Lines(second)))
+        session = sessionData.parseSession(self.filename)
+        self.assertEqual(len(session.calibReversals), sum(line.startswith('REV') for line in first + second))
+        self.assertEqual(session.ranks.tolist(), sessionData.parseSession(self.writeSecond()).ranks.tolist())
+
+    def testIndexUpdatedAcrossRestart(self):
+        first, second = self.writeRestart('START1\n', 47)
+        with open(self.filename, 'w') as f:
+            f.writelines(first)
+        sessionData.sectionIndex(self.filename)
+        with open(self.filename, 'a') as f:
+            f.writelines(second)
+        indexed = sessionData.parseSession(self.filename)
+        os.remove(sessionData.indexPath(self.filename))
+        rebuilt = sessionData.parseSession(self.filename)
+        self.assertEqual(indexed.exp1.tolist(), rebuilt.exp1.tolist())
+        self.assertEqual(indexed.calib.tolist(), rebuilt.calib.tolist())
+
+    def writeSecond(self):
+        '''Writes the full run on its own and returns its filename.'''
+        filename = os.path.join(self.dir, 'expData02.txt')
+        syntheticSessions.writeSession(filename, 2)
+        return filename
+
+    def stairTrials(self, lines, stair):
+        '''Returns the number of calibration trial lines of the given staircase.'''
+        return sum(line.startswith(str(stair) + ' (') for line in lines)
+
+    def exp2Lines(self, lines):
+        '''Returns the trial lines of the second experiment.'''
+        return lines[lines.index('START2\n') + 1:lines.index('END2\n')]
+
+if __name__ == '__main__':
+    unittest.main()
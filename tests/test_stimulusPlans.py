@@ -0,0 +1,74 @@
+'''Tests of the frame plans against the per-frame schedules of the original render loops.'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import stimulusPlans
+
+REFRESH_RATES = (50, 59.94, 60, 75, 85, 100, 119.88, 120, 143.85, 144, 165, 240)
+
+def loopBreakingTime(REFRESH_RATE, blinking):
+    '''Returns the (Mondrian, opacity, Mondrians drawn, stimulus drawn) of every frame of the original circleBreakingTime loop.'''
+    frames = []
+    mondN = 0
+    for frameN in range(int(10.8 * REFRESH_RATE)):
+        if frameN <= 3.0 * REFRESH_RATE:
+            opacity = frameN / (3.0 * REFRESH_RATE)
+        if int(frameN % (REFRESH_RATE / 10.0)) == 0:  # change mondrian 10 times per second
+            mondN += 1
+            if mondN > 9:
+                mondN = 0
+        drawMondrians = drawStim = False
+        if blinking:
+            if frameN % int(REFRESH_RATE * 0.6) < REFRESH_RATE / 3.0 + 4:
+                if frameN < 10 * REFRESH_RATE:
+                    drawMondrians = True
+                if frameN % int(REFRESH_RATE * 0.6) >= 2 and frameN % int(REFRESH_RATE * 0.6) < REFRESH_RATE / 3.0 + 2:
+                    drawStim = True
+        else:
+            drawStim = True
+            if frameN < 10 * REFRESH_RATE:
+                drawMondrians = True
+        frames.append((mondN, opacity, drawMondrians, drawStim))
+    return frames
+
+def loopPrime(REFRESH_RATE):
+    '''Returns the (Mondrian, opacity, Mondrians drawn, prime drawn) of every frame of the original ringPrime loop.'''
+    frames = []
+    mondN = 0
+    for frameN in range(int(2.3 * REFRESH_RATE)):
+        if int(frameN % (REFRESH_RATE / 10.0)) == 0:  # change mondrian 10 times per second
+            mondN += 1
+            if mondN > 9:
+                mondN = 0
+        cycleProgress = frameN % int(REFRESH_RATE * 0.5)
+        drawMondrians = drawStim = False
+        opacity = 0
+        if cycleProgress < REFRESH_RATE / 5 + 6:
+            drawMondrians = True
+            if cycleProgress >= 3 and cycleProgress < REFRESH_RATE / 5 + 3:
+                opacity = (cycleProgress - 2) / (REFRESH_RATE / 5.0 + .01)
+                drawStim = True
+        frames.append((mondN, opacity, drawMondrians, drawStim))
+    return frames
+
+class FramePlanTest(unittest.TestCase):
+
+    def testBreakingTimePlan(self):
+        for rate in REFRESH_RATES:
+            for blinking in (True, False):
+                self.assertEqual(stimulusPlans.breakingTimePlan(rate, blinking).tolist(), loopBreakingTime(rate, blinking),
+                                 'breaking time plan at %s Hz, blinking=%s' % (rate, blinking))
+
+    def testPrimePlan(self):
+        for rate in REFRESH_RATES:
+            self.assertEqual(stimulusPlans.primePlan(rate).tolist(), loopPrime(rate), 'prime plan at %s Hz' % rate)
+
+    def testPlansAreShared(self):
+        plan = stimulusPlans.primePlan(60)
+        self.assertTrue(plan is stimulusPlans.primePlan(60))
+        self.assertFalse(plan.flags.writeable)
+
+if __name__ == '__main__':
+    unittest.main()
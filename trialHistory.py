@@ -0,0 +1,88 @@
+'''
+Histories of trial measures over the course of a session, for many subjects at once.
+
+The trials are laid out as a subjects x trials array with NaN for the trials that are excluded or
+missing. Binned and rolling means come from differences of cumulative sums along the trials, so
+any bin or window width costs one pass over the array, and empty bins give NaN.
+'''
+import numpy as np
+
+def historyMatrix(trials, values, mask=None, compact=False):
+    '''
+    Returns a subjects x trials array of the given values (a column name or an array aligned with
+    the given rows of the pooled table, or of one Session array) with NaN for the trials that are
+    not selected by mask or missing. Each value goes to the index of its trial within its section,
+    or, if compact is True, to its position among the selected trials of its subject (such as the
+    trials of one calibration staircase).
+    '''
+    if isinstance(values, str):
+        values = trials[values]
+    values = np.asarray(values, dtype=float)
+    names = trials.dtype.names
+    subjects = trials['subject'] if 'subject' in names else np.zeros(len(trials), dtype=int)
+    positions = trials['trial'] if 'trial' in names else np.arange(len(trials))
+    if mask is not None:
+        subjects, positions, values = subjects[mask], positions[mask], values[mask]
+    if len(values) == 0:
+        return np.zeros((0, 0))
+    if compact:
+        order = np.argsort(subjects, kind='mergesort')
+        counts = np.bincount(subjects)
+        positions = np.empty(len(values), dtype=int)
+        positions[order] = np.arange(len(values)) - np.repeat(np.cumsum(counts) - counts, counts)
+    matrix = np.full((subjects.max() + 1, positions.max() + 1), np.nan)
+    matrix[subjects, positions] = values
+    return matrix
+
+def _prefixSums(matrix):
+    '''Returns the cumulative sums and counts of the non-NaN values of each row, starting with 0.'''
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+    valid = ~np.isnan(matrix)
+    zeros = np.zeros((len(matrix), 1))
+    return (np.hstack((zeros, np.cumsum(np.where(valid, matrix, 0), axis=1))),
+            np.hstack((zeros, np.cumsum(valid, axis=1))))
+
+def binnedMeans(matrix, width, partial=False):
+    '''
+    Returns the means of the non-NaN values of each row over consecutive bins of the given number of
+    trials (NaN for bins without any). A shorter last bin is only included if partial is True.
+    '''
+    if width < 1:
+        raise ValueError('Bins need a width of at least 1 trial, not ' + str(width))
+    sums, counts = _prefixSums(matrix)
+    nTrials = sums.shape[1] - 1
+    nBins = -(-nTrials // width) if partial else nTrials // width
+    edges = np.minimum(np.arange(nBins + 1) * width, nTrials)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[:, edges[1:]] - sums[:, edges[:-1]]) / (counts[:, edges[1:]] - counts[:, edges[:-1]])
+
+def rollingMeans(matrix, width):
+    '''
+    Returns the means of the non-NaN values of each row over every window of the given number of
+    consecutive trials, the i-th column being the window that starts at trial i (NaN for windows
+    without any value).
+    '''
+    if width < 1:
+        raise ValueError('Windows need a width of at least 1 trial, not ' + str(width))
+    sums, counts = _prefixSums(matrix)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[:, width:] - sums[:, :-width]) / (counts[:, width:] - counts[:, :-width])
+
+def ewmaMeans(matrix, alpha):
+    '''
+    Returns the exponentially weighted means of each row up to every trial, where the weight of a
+    value decays by a factor of 1 - alpha per later trial and NaN values carry no weight (NaN
+    before the first value of a row).
+    '''
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+    valid = ~np.isnan(matrix)
+    filled = np.where(valid, matrix, 0)
+    weightedSums = np.zeros(len(matrix))
+    weights = np.zeros(len(matrix))
+    means = np.empty(matrix.shape)
+    for trial in range(matrix.shape[1]):
+        weightedSums = (1 - alpha) * weightedSums + alpha * filled[:, trial]
+        weights = (1 - alpha) * weights + alpha * valid[:, trial]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[:, trial] = weightedSums / weights
+    return means
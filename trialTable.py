@@ -0,0 +1,322 @@
+'''
+Long-format table of the trials of many subjects, with vectorized group-by reductions over it.
+
+Every trial of every subject is one row of a TRIAL_DTYPE structured array, so per-subject and
+pooled statistics come from a single reduction instead of nested per-subject loops.
+'''
+import numpy as np
+from sessionData import loadSession, parallelMap
+
+EXP1, CALIB, EXP2 = 1, 2, 3  # values of the section column
+CUE_CONDITIONS = ('leastFavOpp', 'leastFavSame', 'favOpp', 'favSame')  # values 0 to 3 of the cue column
+MIN_BREAK_TIME = 0.3   # breaking times at or below this (seconds) are taken as anticipations
+CENSOR_TIME = 10.23    # breaking times at or above this mean the stimulus never broke suppression
+
+# Columns that do not apply to a section are NaN (floats), -1 (integers) or False (booleans).
+TRIAL_DTYPE = np.dtype([('subject', 'i4'),     # position of the subject in the list given to pooledTrials
+                        ('section', 'i1'),     # EXP1, CALIB or EXP2
+                        ('trial', 'i4'),       # index of the trial within its section
+                        ('hue', 'i2'),         # index of the (popout) color in the subject's rainbow-ordered colors
+                        ('rank', 'i1'),        # preference rank of that color (1 for most favorite)
+                        ('loc', 'f8'),         # horizontal stimulus location (first experiment)
+                        ('brkTime', 'f8'),     # breaking time in seconds (first experiment)
+                        ('passed', '?'),       # location task (first experiment) or orientation task passed
+                        ('popColor', 'i1'),    # 1 if the favorite color popped out, 2 if the least favorite
+                        ('popLoc', 'f8'),      # vertical location of the popout cross
+                        ('gabLoc', 'f8'),      # vertical location of the gabor
+                        ('tilt', 'f8'),        # clockwise tilt of the gabor in degrees
+                        ('rt', 'f8'),          # orientation task response time in seconds
+                        ('visibility', 'i1'),  # reported visibility of the prime (0, 1 or 2)
+                        ('seenUp', '?'),       # reported prime location was the top
+                        ('cue', 'i1'),         # index into CUE_CONDITIONS
+                        ('stair', 'i1')])      # calibration staircase (0 or 1)
+
+def _emptyTrials(n, subject, section):
+    '''Returns n rows of TRIAL_DTYPE for the given subject and section with every other column unset.'''
+    trials = np.zeros(n, dtype=TRIAL_DTYPE)
+    for name in TRIAL_DTYPE.names:
+        if TRIAL_DTYPE[name].kind == 'f':
+            trials[name] = np.nan
+        elif TRIAL_DTYPE[name].kind == 'i':
+            trials[name] = -1
+    trials['subject'] = subject
+    trials['section'] = section
+    trials['trial'] = np.arange(n)
+    return trials
+
+def sessionTrials(source, subject):
+    '''Returns the trials of the given session file (or Session) as TRIAL_DTYPE rows labeled with the given subject.'''
+    session = loadSession(source)
+    exp1 = _emptyTrials(len(session.exp1), subject, EXP1)
+    exp1['hue'] = session.exp1['color']
+    exp1['rank'] = session.ranks[session.exp1['color']]
+    for name in ('loc', 'brkTime', 'passed'):
+        exp1[name] = session.exp1[name]
+    ranked = session.rankedColors()
+    parts = [exp1]
+    for section, rows in ((CALIB, session.calib), (EXP2, session.exp2)):
+        trials = _emptyTrials(len(rows), subject, section)
+        for name in ('popColor', 'popLoc', 'gabLoc', 'tilt', 'rt', 'passed', 'visibility', 'seenUp', 'stair'):
+            trials[name] = rows[name]
+        if ranked:
+            fav = rows['popColor'] == 1
+            trials['rank'] = np.where(fav, 1, len(ranked))
+            trials['hue'] = np.where(fav, session.colors.index(session.colorOfRank(1)),
+                                     session.colors.index(session.colorOfRank(len(ranked))))
+        trials['cue'] = 2 * (rows['popColor'] == 1) + (rows['popLoc'] == rows['gabLoc'])
+        parts.append(trials)
+    return np.concatenate(parts)
+
+def pooledTrials(sources, workers=1):
+    '''
+    Returns the trials of all the given session files (or Sessions) stacked into one TRIAL_DTYPE
+    array, where the subject column is the position of the session in sources. The sessions are
+    read over the given number of worker processes (None for one per core).
+    '''
+    if not sources:
+        return np.zeros(0, dtype=TRIAL_DTYPE)
+    return np.concatenate(parallelMap(sessionTrials, [(source, subject) for subject, source in enumerate(sources)],
+                                      workers))
+
+class TrialQuery(object):
+    '''
+    A selection of the rows of a structured trial array (the pooled table or the exp1, calib or
+    exp2 array of a Session) built up by chaining filters, e.g.
+        TrialQuery(session.exp1).breakWindow().passed().left().mask
+    Each filter returns a new query narrowed by a boolean mask, so queries can be branched and
+    shared; the trials themselves are only read, never copied, until rows or values are asked for.
+    '''
+
+    def __init__(self, trials, mask=None):
+        self.trials = trials
+        self.mask = np.ones(len(trials), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    def where(self, mask):
+        '''Returns this query narrowed to the trials where the given mask is True.'''
+        return TrialQuery(self.trials, self.mask & mask)
+
+    def section(self, *sections):
+        '''Keeps the trials of the given sections (EXP1, CALIB or EXP2) of the pooled table.'''
+        return self.where(np.in1d(self.trials['section'], sections))
+
+    def breakWindow(self, low=MIN_BREAK_TIME, high=CENSOR_TIME, includeCensored=False):
+        '''
+        Keeps the trials with a breaking time above low and below high, as well as those at or above
+        high if includeCensored is True.
+        '''
+        brkTimes = self.trials['brkTime']
+        with np.errstate(invalid='ignore'):
+            return self.where((brkTimes > low) & ((brkTimes < high) | includeCensored))
+
+    def censored(self, isCensored=True):
+        '''Keeps the trials whose stimulus never broke suppression (or, if isCensored is False, did).'''
+        with np.errstate(invalid='ignore'):
+            return self.where((self.trials['brkTime'] >= CENSOR_TIME) == isCensored)
+
+    def passed(self, hasPassed=True):
+        '''Keeps the trials whose location or orientation task was passed (or failed if hasPassed is False).'''
+        return self.where(self.trials['passed'] == hasPassed)
+
+    def left(self, isLeft=True):
+        '''Keeps the first experiment trials with the stimulus on the left (or the right if isLeft is False).'''
+        with np.errstate(invalid='ignore'):
+            return self.where((self.trials['loc'] < 0) == isLeft)
+
+    def visibility(self, *levels):
+        '''Keeps the orientation task trials with one of the given reported prime visibilities.'''
+        return self.where(np.in1d(self.trials['visibility'], levels))
+
+    def colors(self, *colors):
+        '''Keeps the trials of the given color indices (hue in the pooled table, color in a Session).'''
+        return self.where(np.in1d(self.trials['hue' if 'hue' in self.trials.dtype.names else 'color'], colors))
+
+    def ranks(self, *ranks):
+        '''Keeps the trials of the given preference ranks (pooled table).'''
+        return self.where(np.in1d(self.trials['rank'], ranks))
+
+    def trialRange(self, start, stop=None):
+        '''Keeps the trials whose index within their section is at least start and below stop.'''
+        if 'trial' in self.trials.dtype.names:
+            index = self.trials['trial']
+        else:
+            index = np.arange(len(self.trials))
+        return self.where((index >= start) & (index < (len(self.trials) if stop is None else stop)))
+
+    def indices(self):
+        '''Returns the positions of the selected trials.'''
+        return np.flatnonzero(self.mask)
+
+    def count(self):
+        '''Returns the number of selected trials.'''
+        return int(self.mask.sum())
+
+    def _select(self, array):
+        '''Returns the selected rows of the given array aligned with the trials, as a view if they are contiguous.'''
+        index = self.indices()
+        if len(index) and index[-1] - index[0] + 1 == len(index):
+            return array[index[0]:index[-1] + 1]
+        return array[index]
+
+    def rows(self):
+        '''Returns the selected trials.'''
+        return self._select(self.trials)
+
+    def values(self, column):
+        '''Returns the given column of the selected trials.'''
+        return self._select(self.trials[column])
+
+def _groupIndex(columns):
+    '''
+    Returns the distinct combinations of the given integer columns as a list of key columns (sorted
+    by key) together with the group index of every row.
+    '''
+    columns = [np.asarray(column).astype(np.int64) for column in columns]
+    lows = [column.min() for column in columns]
+    dims = [column.max() - low + 1 for column, low in zip(columns, lows)]
+    groups, inverse = np.unique(np.ravel_multi_index([column - low for column, low in zip(columns, lows)], dims),
+                                return_inverse=True)
+    return [column + low for column, low in zip(np.unravel_index(groups, dims), lows)], inverse
+
+def groupStats(trials, keys, values, mask=None):
+    '''
+    Groups the given trials by the given integer columns and returns a structured array with one
+    row per group present, sorted by key, holding the key columns and the count, mean and standard
+    error (population standard deviation over the square root of the count) of the given values.
+    values may be a column name or an array aligned with trials, and mask selects the trials used.
+    '''
+    if isinstance(values, str):
+        values = trials[values]
+    values = np.asarray(values, dtype=float)
+    if mask is not None:
+        trials, values = trials[mask], values[mask]
+    dtype = [(key, trials.dtype[key]) for key in keys] + [('count', 'i8'), ('mean', 'f8'), ('sem', 'f8')]
+    if len(trials) == 0:
+        return np.zeros(0, dtype=dtype)
+    keyColumns, inverse = _groupIndex([trials[key] for key in keys])
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, values) / counts
+    squaredDevs = np.bincount(inverse, (values - means[inverse]) ** 2)
+    result = np.zeros(len(counts), dtype=dtype)
+    for key, column in zip(keys, keyColumns):
+        result[key] = column
+    result['count'] = counts
+    result['mean'] = means
+    result['sem'] = np.sqrt(squaredDevs / counts) / np.sqrt(counts)
+    return result
+
+# Grouping keys for orientation task trials that are derived from their columns
+CONDITION_KEYS = {
+    'cue': lambda trials: 2 * (trials['popColor'] == 1) + (trials['popLoc'] == trials['gabLoc']),
+    'cueValid': lambda trials: trials['popLoc'] == trials['gabLoc'],
+    'gaborTop': lambda trials: trials['gabLoc'] > 0,
+    'visible': lambda trials: trials['visibility'] != 0,
+    'calibration': lambda trials: (trials['stair'] >= 0 if 'stair' in trials.dtype.names
+                                   else trials['section'] == CALIB),
+}
+
+def _keyColumn(trials, key):
+    '''Returns the given column of the trials, or the CONDITION_KEYS column of that name.'''
+    return CONDITION_KEYS[key](trials) if key in CONDITION_KEYS else trials[key]
+
+def conditionStats(trials, keys, mask=None):
+    '''
+    Aggregates orientation task trials (a Session's calib/exp2 arrays or rows of the pooled table)
+    in a single pass and returns a structured array with one row per group present, sorted by key,
+    holding the key columns and the trial count, task accuracy, mean and (population) variance of
+    the response time, and the accuracy of the reported prime location. keys are column names such
+    as popColor or visibility, or names of CONDITION_KEYS, and mask selects the trials used.
+    '''
+    if mask is not None:
+        trials = trials[mask]
+    dtype = [(key, 'i8') for key in keys] + [('count', 'i8'), ('accuracy', 'f8'), ('meanRT', 'f8'),
+                                             ('varRT', 'f8'), ('locAccuracy', 'f8')]
+    if len(trials) == 0:
+        return np.zeros(0, dtype=dtype)
+    keyColumns, inverse = _groupIndex([_keyColumn(trials, key) for key in keys])
+    counts = np.bincount(inverse).astype(float)
+    meanRTs = np.bincount(inverse, trials['rt']) / counts
+    result = np.zeros(len(counts), dtype=dtype)
+    for key, column in zip(keys, keyColumns):
+        result[key] = column
+    result['count'] = counts
+    result['accuracy'] = np.bincount(inverse, trials['passed']) / counts
+    result['meanRT'] = meanRTs
+    result['varRT'] = np.bincount(inverse, (trials['rt'] - meanRTs[inverse]) ** 2) / counts
+    result['locAccuracy'] = np.bincount(inverse, (trials['popLoc'] < 0) != trials['seenUp']) / counts
+    return result
+
+def _groupQuantiles(groups, values, q, nGroups):
+    '''
+    Returns the q quantile (0 to 1, interpolated as by np.percentile) of the given values within
+    each of the nGroups groups given by the group index of every value (NaN for empty groups).
+    '''
+    order = np.lexsort((values, groups))
+    counts = np.bincount(groups, minlength=nGroups)
+    starts = np.cumsum(counts) - counts
+    positions = starts + q * np.maximum(counts - 1, 0)
+    below = np.floor(positions).astype(int)
+    above = np.ceil(positions).astype(int)
+    quantiles = np.full(nGroups, np.nan)
+    present = counts > 0
+    sortedValues = values[order]
+    low, high = sortedValues[below[present]], sortedValues[above[present]]
+    quantiles[present] = low + (high - low) * (positions[present] - below[present])
+    return quantiles
+
+def clipMask(groups, values, method='sigma', threshold=3.0, iterations=1, mask=None):
+    '''
+    Returns a mask of the given values that are not outliers within their group, given by an
+    integer group index per value. Only values selected by mask take part and can be kept. The
+    methods are:
+        sigma: within threshold (population) standard deviations of the group mean
+        mad: within threshold scaled median absolute deviations (1.4826 MAD, about a standard
+             deviation for normal data) of the group median
+        percentile: between the threshold and 100 - threshold percentiles of the group
+    The bounds are recomputed from the values kept for the given number of iterations, or until
+    nothing more is removed if iterations is None.
+    '''
+    groups = np.asarray(groups, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    keep = np.ones(len(values), dtype=bool) if mask is None else np.array(mask, dtype=bool)
+    nGroups = groups.max() + 1 if len(groups) else 0
+    iteration = 0
+    while iterations is None or iteration < iterations:
+        kept = np.flatnonzero(keep)
+        if len(kept) == 0:
+            break
+        keptGroups, keptValues = groups[kept], values[kept]
+        if method == 'sigma':
+            counts = np.bincount(keptGroups, minlength=nGroups)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                centers = np.bincount(keptGroups, keptValues, nGroups) / counts
+                spreads = np.sqrt(np.bincount(keptGroups, (keptValues - centers[keptGroups]) ** 2, nGroups) / counts)
+            lower, upper = centers - threshold * spreads, centers + threshold * spreads
+        elif method == 'mad':
+            centers = _groupQuantiles(keptGroups, keptValues, 0.5, nGroups)
+            spreads = 1.4826 * _groupQuantiles(keptGroups, np.abs(keptValues - centers[keptGroups]), 0.5, nGroups)
+            lower, upper = centers - threshold * spreads, centers + threshold * spreads
+        elif method == 'percentile':
+            lower = _groupQuantiles(keptGroups, keptValues, threshold / 100.0, nGroups)
+            upper = _groupQuantiles(keptGroups, keptValues, 1 - threshold / 100.0, nGroups)
+        else:
+            raise ValueError('Unknown outlier method: ' + method)
+        stillKept = (keptValues >= lower[keptGroups]) & (keptValues <= upper[keptGroups])
+        if stillKept.all():
+            break
+        keep[kept[~stillKept]] = False
+        iteration += 1
+    return keep
+
+def outlierMask(trials, keys, values, method='sigma', threshold=3.0, iterations=1, mask=None):
+    '''
+    Returns clipMask of the given values within the groups of trials that share the given columns
+    (names of trials columns or of CONDITION_KEYS), e.g. ('subject', 'hue'), ('subject', 'rank') or
+    ('subject', 'cue'). values may be a column name or an array aligned with trials, and mask selects
+    the trials taking part. The mask can be combined with others and shared by all the analyses.
+    '''
+    if isinstance(values, str):
+        values = trials[values]
+    if len(trials) == 0:
+        return np.zeros(0, dtype=bool)
+    groups = _groupIndex([_keyColumn(trials, key) for key in keys])[1] if keys else np.zeros(len(trials), dtype=int)
+    return clipMask(groups, values, method, threshold, iterations, mask)
@@ -0,0 +1,109 @@
+'''
+Background writing of the session files of color_preference_ST.py.
+
+A TrialWriter takes whole lines (complete trial records, section markers) and console messages
+from the experiment through a queue and writes them from its own thread, so neither disk nor
+console latency lands inside a trial. Every line is written with one write call, the file is
+flushed whenever the queue runs empty and fsynced at the block boundaries the experiment marks
+with sync() and on close. A line left incomplete by a crash is cut off when the file is opened
+again (see repairTornLine), since the parsers skip anything that does not have a trial's layout
+but a torn line would run into the next record.
+'''
+import atexit
+import os
+import sys
+import threading
+import Queue
+
+def repairTornLine(filename):
+    '''
+    Truncates the given file after its last newline, removing a last line that was never finished,
+    and returns the removed text ('' if the file ends with a newline or does not exist).
+    '''
+    if not os.path.exists(filename):
+        return ''
+    with open(filename, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        start, tail = size, ''
+        while start > 0 and '\n' not in tail:
+            step = min(4096, start)
+            start -= step
+            f.seek(start)
+            tail = f.read(step) + tail
+        cut = start + tail.rfind('\n') + 1
+        if cut == size:
+            return ''
+        f.seek(cut)
+        torn = f.read()
+        f.truncate(cut)
+        f.flush()
+        os.fsync(f.fileno())
+    return torn
+
+class TrialWriter(object):
+    '''Appends lines to a file from a background thread fed by a queue.'''
+
+    def __init__(self, filename):
+        self.name = filename
+        self.torn = repairTornLine(filename)  # text of a torn last line cut off from a previous run
+        self._file = open(filename, 'a')
+        self._queue = Queue.Queue()
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        '''Writes the queued items until close() queues None.'''
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, text = item
+            try:
+                if kind == 'line':
+                    self._file.write(text)
+                elif kind == 'echo':
+                    sys.stdout.write(text + '\n')
+                    sys.stdout.flush()
+                elif kind == 'sync':
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                if self._queue.empty():
+                    self._file.flush()
+            except (IOError, OSError) as e:
+                self._error = e
+
+    def _put(self, kind, text):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((kind, text))
+
+    def write(self, text, echo=None):
+        '''Queues the given whole lines (ending with a newline) and an optional console message.'''
+        self._put('line', text)
+        if echo is not None:
+            self._put('echo', echo)
+
+    def echo(self, text):
+        '''Queues a message for the console, printed in order with the lines written.'''
+        self._put('echo', text)
+
+    def sync(self):
+        '''Marks a block boundary: the lines queued so far are flushed and fsynced to disk.'''
+        self._put('sync', None)
+
+    def close(self):
+        '''Writes out everything queued, fsyncs and closes the file (only the first call does anything).'''
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(('sync', None))
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error